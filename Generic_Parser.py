@@ -32,20 +32,25 @@ The program outputs:
   McDonald 2016/06
 """
 
+import argparse
+from collections import Counter
 import csv
+import gc
 import glob
+import json
+import multiprocessing
 import os
 import re
-import string
 import sys
 import time
 #sys.path.append('D:\GD\Python\TextualAnalysis\Modules')  # Modify to identify path for custom modules
 import Load_MasterDictionary as LM
 
+import numpy as np
 from tqdm import tqdm
 
 """
-    Specify File Locations for Generic Parser.py
+    Default File Locations for Generic Parser.py, see python Generic_Parser.py -h
 """
 
 # User defined directory for files to be parsed
@@ -64,24 +69,203 @@ OUTPUT_FIELDS = ['filename', 'file size', 'number of words', '% positive', '% ne
                  '# of numbers', 'avg # of syllables per word', 'average word length', 'vocabulary',
                  'CIK']
 
-lm_dictionary = LM.load_masterdictionary(MASTER_DICTIONARY_FILE, True)
+# Scoring code version, bump when the row of a document changes so that
+# --incremental rescores rows written by older code
+SCORER_VERSION = 2
 
-def main():
+# Dictionary flags in _odata[3:11] order
+SCORE_CATEGORIES = ['positive', 'negative', 'uncertainty', 'litigious', 'weak_modal',
+                    'moderate_modal', 'strong_modal', 'constraining']
 
-    f_out = open(OUTPUT_FILE, 'w')
-    wr = csv.writer(f_out, lineterminator='\n')
-    wr.writerow(OUTPUT_FIELDS)
 
-    file_list = glob.glob(TARGET_FILES)
+def build_score_table(dictionary):
+    """
+        Pack the dictionary into a sorted array of words and an aligned int64
+        table with columns [1, 8 category flags, syllables, word length]; a
+        document's totals are token counts @ table[token rows].
+        Only words counted by get_data (not digits, longer than 1) are kept.
+        Both are plain numpy buffers, so forked workers share them read-only
+        without the refcount writes that copy pages of python objects.
+    """
+    rows = dictionary.unique_rows()
+    words = dictionary.columns['word'][rows]
+    counted = ~np.char.isdigit(words) & (np.char.str_len(words) > 1)
+    rows, words = rows[counted], words[counted]
 
-    for filename in tqdm(file_list):
+    table = np.zeros((len(words), len(SCORE_CATEGORIES) + 3), dtype=np.int64)
+    table[:, 0] = 1
+    for j, category in enumerate(SCORE_CATEGORIES):
+        table[:, j + 1] = dictionary.flags(category)[rows]
+    table[:, -2] = dictionary.columns['syllables'][rows]
+    table[:, -1] = np.char.str_len(words)
+
+    return np.array(words), table
+
+
+# Numbers are counted in the original document with the result of the
+# former passes: re.sub drops '.' and ',' before an ASCII digit (1,234.5 is
+# one word), translate turns other punctuation (including '_') into spaces,
+# and \b[-+\(]?[$€£]?[-+(]?\d+\)?\b counts the words of only digits.
+
+# A character of such words: a word character other than '_', or a '.' / ','
+# that re.sub would have dropped
+_WORD_CHAR = r'(?:[^\W_]|[.,](?=[0-9]))'
+# A character of such words made of digits only
+_NUMBER_CHAR = r'(?:\d|[.,](?=[0-9]))'
+# Whole words only: a number never starts or ends next to another word
+# character, which also keeps backtracking from stopping inside a word
+NUMBER = re.compile(r'(?<!{0}){1}+(?!{0})'.format(_WORD_CHAR, _NUMBER_CHAR))
+
+# Dictionaries loaded in this process: csv path -> (dictionary, words, table)
+_DICTIONARIES = {}
+
+# Files handed to a worker at a time in parallel mode
+CHUNK_SIZE = 16
+
+
+class Scorer(object):
+    """
+        Loughran-McDonald scoring of documents. The dictionary is loaded on
+        first use and shared by every Scorer of the same csv in the process,
+        a Scorer only holds its path and pickles cheaply to workers.
+    """
+    def __init__(self, dictionary_file=MASTER_DICTIONARY_FILE, print_flag=False):
+        self.dictionary_file = os.path.abspath(dictionary_file)
+        self.print_flag = print_flag
+
+    def load(self):
+        """
+            (dictionary, words, table) of the csv, loaded once per process
+        """
+        loaded = _DICTIONARIES.get(self.dictionary_file)
+        if loaded is None:
+            dictionary = LM.load_masterdictionary(self.dictionary_file, self.print_flag)
+            loaded = (dictionary,) + build_score_table(dictionary)
+            _DICTIONARIES[self.dictionary_file] = loaded
+        return loaded
+
+    @property
+    def dictionary(self):
+        return self.load()[0]
+
+    @property
+    def version(self):
+        """
+            sha1 of the dictionary csv, rows scored with another version are stale
+        """
+        return LM.file_hash(self.dictionary_file)
+
+    def score_files(self, file_list, output_file, jobs=1):
+        """
+            Write the OUTPUT_FIELDS rows of file_list to output_file, in order
+        """
+        with open(output_file, 'w') as f_out:
+            wr = csv.writer(f_out, lineterminator='\n')
+            wr.writerow(OUTPUT_FIELDS)
+            for output_data in tqdm(self.imap(file_list, jobs), total=len(file_list)):
+                wr.writerow(output_data)
+
+    def update(self, file_list, output_file, jobs=1):
+        """
+            Score only the files that are new or changed (size, mtime) since
+            the last update of output_file and merge them with its other rows.
+            Files no longer in file_list are dropped. The manifest of scored
+            files is kept in output_file + '.manifest.json', a dictionary or
+            scoring code change rescores every file.
+        """
+        manifest_path = output_file + '.manifest.json'
+        version = {'dictionary': self.version, 'scorer': SCORER_VERSION, 'fields': OUTPUT_FIELDS}
+
+        entries, rows = {}, []
+        if os.path.exists(output_file) and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if all(manifest.get(key) == value for key, value in version.items()):
+                entries = manifest['files']
+                with open(output_file, 'r') as f_in:
+                    reader = csv.reader(f_in)
+                    next(reader, None)
+                    rows = [row for row in reader if row]
+            else:
+                print('Dictionary or scoring code changed since the last update, rescoring all files')
+
+        # path -> [size, mtime, row index in output_file], rows are named by
+        # the base filename only, so files are told apart by their full path
+        files = {}
+        stale = []
+        for filename in file_list:
+            stat = os.stat(filename)
+            entry = [stat.st_size, stat.st_mtime_ns]
+            previous = entries.get(filename)
+            if previous and previous[:2] == entry and previous[2] < len(rows):
+                files[filename] = rows[previous[2]]
+            else:
+                stale.append(filename)
+                files[filename] = None
+            entries[filename] = entry
+        print('{} of {} files to score'.format(len(stale), len(file_list)))
+
+        for filename, output_data in zip(stale, tqdm(self.imap(stale, jobs), total=len(stale))):
+            files[filename] = output_data
+
+        # Replace the result and then the manifest, an interrupted update is redone
+        with open(output_file + '.tmp', 'w') as f_out:
+            wr = csv.writer(f_out, lineterminator='\n')
+            wr.writerow(OUTPUT_FIELDS)
+            for filename in file_list:
+                wr.writerow(files[filename])
+        os.replace(output_file + '.tmp', output_file)
+
+        manifest = dict(version, files={filename: entries[filename] + [i] for i, filename in enumerate(file_list)})
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def imap(self, file_list, jobs=1):
+        """
+            Yield the rows of file_list in order, scored on jobs processes
+        """
+        if jobs <= 1:
+            for filename in file_list:
+                yield self.score_file(filename)
+            return
+
+        # Workers forked after the dictionary is loaded share its pages.
+        # Frozen objects are never scanned by the collector, which would
+        # otherwise write to their headers and copy the pages in each worker.
+        self.load()
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        gc.freeze()
+        try:
+            with context.Pool(jobs) as pool:
+                # imap keeps rows in file_list order while they stream to the caller
+                for output_data in pool.imap(self.score_file, file_list, CHUNK_SIZE):
+                    yield output_data
+        finally:
+            # Objects of an embedding process are collected again once the pool is gone
+            gc.unfreeze()
+
+    def score_file(self, filename):
+        """
+            Return the OUTPUT_FIELDS row of the file
+        """
         with open(filename, 'r', encoding='UTF-8', errors='ignore') as f_in:
             doc = f_in.read()
+
+        return self.score_document(doc, filename)
+
+    def score_document(self, doc, filename):
+        """
+            Return the OUTPUT_FIELDS row of a document read from filename
+        """
         doc_len = len(doc)
-        doc = re.sub('(May|MAY)', ' ', doc)  # drop all May month references
+        doc = doc.replace('May', ' ').replace('MAY', ' ')  # drop all May month references
         doc = doc.upper()  # for this parse caps aren't informative so shift
 
-        output_data = get_data(doc)
+        output_data = self.get_data(doc)
 
         fname = os.path.basename(filename)
 
@@ -94,42 +278,86 @@ def main():
         output_data[0]  = clean_filename
         output_data[1]  = doc_len
         output_data[-1] = CIK
-        wr.writerow(output_data)
+        return output_data
+
+    def get_data(self, doc):
+        return self.get_data_batch([doc])[0]
+
+    def get_data_batch(self, docs):
+        """
+            get_data of many documents, dictionary totals of every document come
+            from one reduction over their (document, word id, count) triples
+        """
+        _, lm_words, lm_table = self.load()
+
+        doc_index, ids, counts = [], [], []
+        for i, doc in enumerate(docs):
+            tokens = Counter(re.findall('\w+', doc))  # Note that \w+ splits hyphenated words
+            if not tokens:
+                continue
+            # Dictionary rows of the distinct tokens by binary search in lm_words
+            keys = np.array(list(tokens))
+            rows = np.minimum(np.searchsorted(lm_words, keys), len(lm_words) - 1)
+            found = lm_words[rows] == keys
+            doc_index.append(np.full(found.sum(), i, dtype=np.int64))
+            ids.append(rows[found])
+            counts.append(np.fromiter(tokens.values(), dtype=np.int64, count=len(tokens))[found])
+
+        totals = np.zeros((len(docs), lm_table.shape[1]), dtype=np.int64)
+        vocabulary = np.zeros(len(docs), dtype=np.int64)
+        if doc_index:
+            doc_index = np.concatenate(doc_index)
+            counts = np.concatenate(counts)
+            np.add.at(totals, doc_index, lm_table[np.concatenate(ids)] * counts[:, None])
+            vocabulary = np.bincount(doc_index, minlength=len(docs))
+
+        return [_output_data(doc, doc_totals, doc_vocabulary)
+                for doc, doc_totals, doc_vocabulary in zip(docs, totals.tolist(), vocabulary.tolist())]
+
+
+def main(target_files=TARGET_FILES, dictionary_file=MASTER_DICTIONARY_FILE, output_file=OUTPUT_FILE, jobs=1,
+         incremental=False):
+
+    scorer = Scorer(dictionary_file, print_flag=True)
+    if incremental:
+        scorer.update(glob.glob(target_files), output_file, jobs)
+    else:
+        scorer.score_files(glob.glob(target_files), output_file, jobs)
+
+
+# Module level scoring with the default dictionary
+def score_file(filename):
+    return Scorer().score_file(filename)
+
+
+def score_document(doc, filename):
+    return Scorer().score_document(doc, filename)
 
 
 def get_data(doc):
+    return Scorer().get_data(doc)
+
+
+def get_data_batch(docs):
+    return Scorer().get_data_batch(docs)
+
+
+def _output_data(doc, totals, vocabulary):
 
-    vdictionary = {}
     _odata = [0] * 18 # Modified for CIK
-    total_syllables = 0
-    word_length = 0
-
-    tokens = re.findall('\w+', doc)  # Note that \w+ splits hyphenated words
-    for token in tokens:
-        if not token.isdigit() and len(token) > 1 and token in lm_dictionary:
-            _odata[2] += 1  # word count
-            word_length += len(token)
-            if token not in vdictionary:
-                vdictionary[token] = 1
-            if lm_dictionary[token].positive: _odata[3] += 1
-            if lm_dictionary[token].negative: _odata[4] += 1
-            if lm_dictionary[token].uncertainty: _odata[5] += 1
-            if lm_dictionary[token].litigious: _odata[6] += 1
-            if lm_dictionary[token].weak_modal: _odata[7] += 1
-            if lm_dictionary[token].moderate_modal: _odata[8] += 1
-            if lm_dictionary[token].strong_modal: _odata[9] += 1
-            if lm_dictionary[token].constraining: _odata[10] += 1
-            total_syllables += lm_dictionary[token].syllables
-
-    _odata[11] = len(re.findall('[A-Z]', doc))
-    _odata[12] = len(re.findall('[0-9]', doc))
-    # drop punctuation within numbers for number count
-    doc = re.sub('(?!=[0-9])(\.|,)(?=[0-9])', '', doc)
-    doc = doc.translate(str.maketrans(string.punctuation, " " * len(string.punctuation)))
-    _odata[13] = len(re.findall(r'\b[-+\(]?[$€£]?[-+(]?\d+\)?\b', doc))
+    _odata[2] = totals[0]  # word count
+    _odata[3:11] = totals[1:9]
+    total_syllables = totals[9]
+    word_length = totals[10]
+
+    # ASCII letters and digits from a byte histogram, other utf-8 bytes are >= 0x80
+    histogram = np.bincount(np.frombuffer(doc.encode('utf-8', 'surrogatepass'), dtype=np.uint8), minlength=256)
+    _odata[11] = int(histogram[ord('A'):ord('Z') + 1].sum())
+    _odata[12] = int(histogram[ord('0'):ord('9') + 1].sum())
+    _odata[13] = len(NUMBER.findall(doc))
     _odata[14] = total_syllables / _odata[2]
     _odata[15] = word_length / _odata[2]
-    _odata[16] = len(vdictionary)
+    _odata[16] = vocabulary
 
     # Convert counts to %
     for i in range(3, 10 + 1):
@@ -140,6 +368,19 @@ def get_data(doc):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target_files', type=str, default=TARGET_FILES,
+                        help='glob of the files to score')
+    parser.add_argument('--dictionary', type=str, default=MASTER_DICTIONARY_FILE,
+                        help='Loughran-McDonald master dictionary csv')
+    parser.add_argument('--output', type=str, default=OUTPUT_FILE,
+                        help='result csv file')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='worker processes scoring files, sharing the loaded dictionary')
+    parser.add_argument('--incremental', action='store_true',
+                        help='score only new or changed files and merge them into the output')
+    args = parser.parse_args()
+
     print('\n' + time.strftime('%c') + '\nGeneric_Parser.py\n')
-    main()
+    main(args.target_files, args.dictionary, args.output, args.jobs, args.incremental)
     print('\n' + time.strftime('%c') + '\nNormal termination.')
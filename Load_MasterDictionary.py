@@ -2,10 +2,29 @@
 """Routine to load MasterDictionary class"""
 # BDM : 201510
 
+from collections.abc import Mapping
+import hashlib
+import json
+import os
 import time
 
-def load_masterdictionary(file_path, print_flag=False, f_log=None, get_other=False):
-    _master_dictionary = {}
+import numpy as np
+
+# Bump when the cache layout changes, older caches are rebuilt
+CACHE_VERSION = 1
+
+# Numeric csv columns 1..17 and their MasterDictionary attributes
+NUMERIC_COLUMNS = [('sequence_number', np.int64), ('word_count', np.int64), ('word_proportion', np.float64),
+                   ('average_proportion', np.float64), ('std_dev_prop', np.float64), ('doc_count', np.int64),
+                   ('negative', np.int64), ('positive', np.int64), ('uncertainty', np.int64),
+                   ('litigious', np.int64), ('constraining', np.int64), ('superfluous', np.int64),
+                   ('interesting', np.int64), ('modal_number', np.int64), ('irregular_verb', np.int64),
+                   ('harvard_iv', np.int64), ('syllables', np.int64)]
+
+# Modal categories are values of the modal_number column
+MODAL_NUMBERS = {'strong_modal': 1, 'moderate_modal': 2, 'weak_modal': 3}
+
+def load_masterdictionary(file_path, print_flag=False, f_log=None, get_other=False, use_cache=True):
     _sentiment_categories = ['negative', 'positive', 'uncertainty', 'litigious', 'constraining',
                              'strong_modal', 'weak_modal']
     # Load slightly modified nltk stopwords.  I do not use nltk import to avoid versioning errors.
@@ -24,15 +43,18 @@ def load_masterdictionary(file_path, print_flag=False, f_log=None, get_other=Fal
                        'NO', 'NOR', 'NOT', 'ONLY', 'OWN', 'SAME', 'SO', 'THAN', 'TOO', 'VERY', 'CAN',
                        'JUST', 'SHOULD', 'NOW']
 
-    with open(file_path) as f:
-        _total_documents = 0
-        _md_header = f.readline()
-        for line in f:
-            cols = line.split(',')
-            _master_dictionary[cols[0]] = MasterDictionary(cols, _stopwords)
-            _total_documents += _master_dictionary[cols[0]].doc_count
-            if len(_master_dictionary) % 5000 == 0 and print_flag:
-                print('\r ...Loading Master Dictionary' + ' {}'.format(len(_master_dictionary)), end='', flush=True)
+    columns, _md_header = None, None
+    if use_cache:
+        columns, _md_header = _load_cache(file_path)
+    if columns is None:
+        if print_flag:
+            print(' ...Loading Master Dictionary from csv', end='', flush=True)
+        columns, _md_header = _parse_csv(file_path, _stopwords)
+        if use_cache:
+            _save_cache(file_path, columns, _md_header)
+
+    _master_dictionary = MasterDictionaryTable(columns)
+    _total_documents = int(columns['doc_count'].sum())
 
     if print_flag:
         print('\r', end='')  # clear line
@@ -54,9 +76,91 @@ def load_masterdictionary(file_path, print_flag=False, f_log=None, get_other=Fal
         return _master_dictionary
 
 
+def _parse_csv(file_path, _stopwords):
+    """
+        Parse the csv into one structured array row per line, in file order
+    """
+    words, numbers, sources = [], [], []
+    with open(file_path) as f:
+        _md_header = f.readline()
+        for line in f:
+            cols = line.split(',')
+            words.append(cols[0])
+            numbers.append(tuple(cols[1:18]))
+            sources.append(cols[18])  # keeps the line break, as MasterDictionary.source always has
+
+    dtype = ([('word', 'U{}'.format(max(map(len, words), default=1)))] + NUMERIC_COLUMNS +
+             [('source', 'U{}'.format(max(map(len, sources), default=1))), ('stopword', np.bool_)])
+    columns = np.zeros(len(words), dtype=dtype)
+    columns['word'] = words
+    numbers = np.array(numbers, dtype=str).reshape(len(words), len(NUMERIC_COLUMNS))
+    for i, (name, column_type) in enumerate(NUMERIC_COLUMNS):
+        columns[name] = numbers[:, i].astype(column_type)
+    columns['source'] = sources
+    columns['stopword'] = np.isin(np.char.upper(columns['word']), _stopwords)
+    return columns, _md_header
+
+
+def _cache_paths(file_path):
+    base = os.path.splitext(file_path)[0]
+    return base + '.npy', base + '.json'
+
+
+def file_hash(file_path):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _load_cache(file_path):
+    """
+        Memory mapped columns of a cache built from the current csv, (None, None) if stale.
+        A csv with a new mtime but the same size is hashed before being reparsed.
+    """
+    cache_path, meta_path = _cache_paths(file_path)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        stat = os.stat(file_path)
+        if meta['version'] != CACHE_VERSION or meta['size'] != stat.st_size:
+            return None, None
+        if meta['mtime'] != stat.st_mtime_ns:
+            if meta['sha1'] != file_hash(file_path):
+                return None, None
+            meta['mtime'] = stat.st_mtime_ns
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        return np.load(cache_path, mmap_mode='r'), meta['header']
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def _save_cache(file_path, columns, _md_header):
+    cache_path, meta_path = _cache_paths(file_path)
+    stat = os.stat(file_path)
+    meta = {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+            'sha1': file_hash(file_path), 'header': _md_header}
+    try:
+        np.save(cache_path, columns)
+        # The sidecar is written last, a cache without it is never read
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+    except OSError as e:
+        print('Master Dictionary cache {} not written: {}'.format(cache_path, e))
+
+
 def create_sentimentdictionaries(_master_dictionary, _sentiment_categories):
 
     _sentiment_dictionary = {}
+    if isinstance(_master_dictionary, MasterDictionaryTable):
+        # Select each category's words from its column
+        for category in _sentiment_categories:
+            words = _master_dictionary.words(_master_dictionary.flags(category))
+            _sentiment_dictionary[category] = dict.fromkeys(words, 0)
+        return _sentiment_dictionary
+
     for category in _sentiment_categories:
         _sentiment_dictionary[category] = {}
     # Create dictionary of sentiment dictionaries with count set = 0
@@ -68,7 +172,72 @@ def create_sentimentdictionaries(_master_dictionary, _sentiment_categories):
     return _sentiment_dictionary
 
 
+class MasterDictionaryTable(Mapping):
+    """
+        Read only word -> MasterDictionary mapping over the structured array
+        of all csv rows. Records are built on lookup, whole columns are
+        available as table.columns[name] and table.flags(category).
+        As in a dict loaded line by line, a repeated word maps to its last row.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self._ids = None
+
+    @property
+    def ids(self):
+        """
+            word -> row id, built on first use
+        """
+        if self._ids is None:
+            self._ids = {word: i for i, word in enumerate(self.columns['word'].tolist())}
+        return self._ids
+
+    def unique_rows(self):
+        """
+            Row ids of the distinct words, in word order
+        """
+        words = self.columns['word']
+        order = np.argsort(words, kind='stable')
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = words[order[1:]] != words[order[:-1]]
+        return order[last]
+
+    def flags(self, category):
+        """
+            Boolean column of a sentiment category or modal attribute
+        """
+        if category in MODAL_NUMBERS:
+            return self.columns['modal_number'] == MODAL_NUMBERS[category]
+        return self.columns[category] != 0
+
+    def words(self, mask):
+        """
+            Distinct words of the rows in mask, in file order
+        """
+        rows = self.unique_rows()
+        rows = np.sort(rows[mask[rows]])
+        return self.columns['word'][rows].tolist()
+
+    def __getitem__(self, word):
+        return MasterDictionary.from_row(self.columns[self.ids[word]])
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
 class MasterDictionary:
+    __slots__ = ['word', 'sequence_number', 'word_count', 'word_proportion', 'average_proportion',
+                 'std_dev_prop', 'doc_count', 'negative', 'positive', 'uncertainty', 'litigious',
+                 'constraining', 'superfluous', 'interesting', 'modal_number', 'strong_modal',
+                 'moderate_modal', 'weak_modal', 'irregular_verb', 'harvard_iv', 'syllables',
+                 'source', 'stopword']
+
     def __init__(self, cols, _stopwords):
         self.word = cols[0].upper()
         self.sequence_number = int(cols[1])
@@ -94,14 +263,6 @@ class MasterDictionary:
         self.weak_modal = False
         if int(cols[14]) == 3:
             self.weak_modal = True
-        self.sentiment = {}
-        self.sentiment['negative'] = bool(self.negative)
-        self.sentiment['positive'] = bool(self.positive)
-        self.sentiment['uncertainty'] = bool(self.uncertainty)
-        self.sentiment['litigious'] = bool(self.litigious)
-        self.sentiment['constraining'] = bool(self.constraining)
-        self.sentiment['strong_modal'] = bool(self.strong_modal)
-        self.sentiment['weak_modal'] = bool(self.weak_modal)
         self.irregular_verb = int(cols[15])
         self.harvard_iv = int(cols[16])
         self.syllables = int(cols[17])
@@ -113,6 +274,32 @@ class MasterDictionary:
             self.stopword = False
         return
 
+    @classmethod
+    def from_row(cls, row):
+        """
+            Record of a MasterDictionaryTable row
+        """
+        self = cls.__new__(cls)
+        self.word = str(row['word']).upper()
+        for name, column_type in NUMERIC_COLUMNS:
+            setattr(self, name, row[name].item())
+        self.strong_modal = self.modal_number == 1
+        self.moderate_modal = self.modal_number == 2
+        self.weak_modal = self.modal_number == 3
+        self.source = str(row['source'])
+        self.stopword = bool(row['stopword'])
+        return self
+
+    @property
+    def sentiment(self):
+        return {'negative': bool(self.negative),
+                'positive': bool(self.positive),
+                'uncertainty': bool(self.uncertainty),
+                'litigious': bool(self.litigious),
+                'constraining': bool(self.constraining),
+                'strong_modal': bool(self.strong_modal),
+                'weak_modal': bool(self.weak_modal)}
+
 if __name__ == '__main__':
     # Full test program in /TextualAnalysis/TestPrograms/Test_Load_MasterDictionary.py
     print(time.strftime('%c') + '/n')
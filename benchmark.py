@@ -0,0 +1,285 @@
+"""
+    Throughput and peak memory of the hot paths on a synthetic corpus
+
+    python benchmark.py -o bench.json                 run every benchmark
+    python benchmark.py -o bench.json --only html_lxml parse_mda
+    python benchmark.py --compare old.json new.json   ratios, exit 1 on regressions
+
+    The corpus (synthcorpus.py) is generated once into --corpus_dir from
+    --seed, so runs on different commits and machines see the same input.
+    Each benchmark is timed --repeat times, the best run gives MB/s and
+    items/s, and one more run under tracemalloc gives the peak of python
+    and numpy allocations. The results file records the commit and the
+    python / numpy versions next to the numbers.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from executor import available_cpus
+from form10k import Form10k, split_submission
+from formindex import FormIndex
+from Generic_Parser import Scorer
+import htmltext
+import Load_MasterDictionary as LM
+from mdaparser import MDAParser
+import synthcorpus
+
+class SkipBenchmark(Exception):
+    pass
+
+class Inputs(object):
+    """
+        Corpus files and the intermediate texts of every stage, computed
+        once and shared by the benchmarks
+    """
+    def __init__(self, corpus_dir):
+        self.corpus_dir = corpus_dir
+        self.submission_paths, self.index_path, self.dictionary_path = synthcorpus.corpus_paths(corpus_dir)
+        self.submissions = []
+        for path in self.submission_paths:
+            with open(path, 'rb') as fin:
+                self.submissions.append(fin.read())
+
+        self.form10k = Form10k(None)
+        self.mda_parser = MDAParser(None, None)
+        self.documents = [split_submission(content)[0][1] for content in self.submissions]
+        self.html_texts = [htmltext.get_text(doc) for doc in self.documents]
+        self.texts = [self.form10k._process_text(text) for text in self.html_texts]
+        self.mdas = [self.mda_parser.find_mda(text) for text in self.texts]
+        self.lines = [line for mda in self.mdas for line in mda.splitlines() if line.strip()]
+
+def nbytes(items):
+    return sum(len(x) for x in items)
+
+def utf8_bytes(texts):
+    return sum(len(x.encode('utf-8')) for x in texts)
+
+# Each benchmark returns (run, bytes processed, items processed) for its inputs
+
+def bench_formindex_extract(inputs, args):
+    index_dir = os.path.join(inputs.corpus_dir, 'index')
+    formindex = FormIndex(index_dir)
+    index_path = os.path.join(index_dir, 'form_year2015_qtr1.index')
+    shutil.copy(inputs.index_path, index_path)
+    store_path = os.path.join(index_dir, 'form_year2015_qtr1.npy')
+    nrows = len(formindex.extract(index_path))
+
+    def run():
+        # Drop the cached array so every run parses
+        if os.path.exists(store_path):
+            os.remove(store_path)
+        formindex.extract(index_path)
+    return run, os.path.getsize(index_path), nrows
+
+def bench_parse_submission(inputs, args):
+    def run():
+        for content in inputs.submissions:
+            inputs.form10k._parse_submission(content)
+    return run, nbytes(inputs.submissions), len(inputs.submissions)
+
+def bench_html(backend):
+    def bench(inputs, args):
+        try:
+            htmltext.get_text(inputs.documents[0], backend)
+        except ImportError as e:
+            raise SkipBenchmark(str(e))
+
+        def run():
+            for doc in inputs.documents:
+                htmltext.get_text(doc, backend)
+        return run, nbytes(inputs.documents), len(inputs.documents)
+    return bench
+
+def bench_process_text(inputs, args):
+    def run():
+        for text in inputs.html_texts:
+            inputs.form10k._process_text(text)
+    return run, utf8_bytes(inputs.html_texts), len(inputs.html_texts)
+
+def bench_parse_mda(inputs, args):
+    def run():
+        for text in inputs.texts:
+            inputs.mda_parser.parse_mda(text)
+    return run, utf8_bytes(inputs.texts), len(inputs.texts)
+
+def bench_parse_mda_bytes(inputs, args):
+    texts = [text.encode('utf-8') for text in inputs.texts]
+
+    def run():
+        for text in texts:
+            inputs.mda_parser.parse_mda(text)
+    return run, nbytes(texts), len(texts)
+
+def bench_get_data(inputs, args):
+    scorer = Scorer(inputs.dictionary_path)
+    scorer.load()
+    docs = [mda.upper() for mda in inputs.mdas]
+
+    def run():
+        for doc in docs:
+            scorer.get_data(doc)
+    return run, utf8_bytes(docs), len(docs)
+
+def bench_get_data_batch(inputs, args):
+    scorer = Scorer(inputs.dictionary_path)
+    scorer.load()
+    docs = [mda.upper() for mda in inputs.mdas]
+    return (lambda: scorer.get_data_batch(docs)), utf8_bytes(docs), len(docs)
+
+def bench_load_masterdictionary(use_cache):
+    def bench(inputs, args):
+        path = inputs.dictionary_path
+        # Build the cache once, runs with use_cache load it
+        dictionary = LM.load_masterdictionary(path, use_cache=True)
+        return (lambda: LM.load_masterdictionary(path, use_cache=use_cache)), os.path.getsize(path), len(dictionary)
+    return bench
+
+def bench_transform(engine):
+    def bench(inputs, args):
+        try:
+            import utils  # preprocess of both transforms
+            if engine == 'npencoder':
+                from npencoder import Model
+                model = Model(nbatch=args.batch_size, model_dir=args.model_dir)
+            else:
+                from encoder import Model
+                model = Model(nbatch=args.batch_size)
+        except (ImportError, IOError, OSError) as e:
+            raise SkipBenchmark('{}: {}'.format(type(e).__name__, e))
+
+        lines = inputs.lines[:args.encoder_lines]
+        return (lambda: model.transform(lines)), utf8_bytes(lines), len(lines)
+    return bench
+
+BENCHMARKS = [('formindex_extract', bench_formindex_extract),
+              ('parse_submission', bench_parse_submission)] + \
+             [('html_' + backend, bench_html(backend)) for backend in sorted(htmltext.BACKENDS)] + \
+             [('process_text', bench_process_text),
+              ('parse_mda', bench_parse_mda),
+              ('parse_mda_bytes', bench_parse_mda_bytes),
+              ('get_data', bench_get_data),
+              ('get_data_batch', bench_get_data_batch),
+              ('load_masterdictionary_csv', bench_load_masterdictionary(False)),
+              ('load_masterdictionary_cached', bench_load_masterdictionary(True)),
+              ('npencoder_transform', bench_transform('npencoder')),
+              ('encoder_transform', bench_transform('encoder'))]
+
+def measure(run, repeat):
+    """
+        (seconds of each run, peak traced bytes of one more run)
+    """
+    seconds = []
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - _start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+def environment():
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=repo_dir,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=repo_dir, stderr=subprocess.DEVNULL).strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {'commit': commit, 'dirty': dirty, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpus': available_cpus()}
+
+def run_benchmarks(args):
+    corpus = synthcorpus.write_corpus(args.corpus_dir, args.filings, args.seed, args.size_kb, args.index_rows)
+    inputs = Inputs(args.corpus_dir)
+    results = {'environment': environment(), 'corpus': corpus, 'repeat': args.repeat, 'benchmarks': {}}
+
+    for name, bench in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        try:
+            run, nbytes, nitems = bench(inputs, args)
+        except SkipBenchmark as e:
+            print('{:<30} skipped: {}'.format(name, e))
+            results['benchmarks'][name] = {'skipped': str(e)}
+            continue
+
+        seconds, peak = measure(run, args.repeat)
+        best = min(seconds)
+        results['benchmarks'][name] = {'seconds': best,
+                                       'runs': seconds,
+                                       'bytes': nbytes,
+                                       'items': nitems,
+                                       'mb_per_sec': nbytes / 1e6 / best,
+                                       'items_per_sec': nitems / best,
+                                       'peak_mb': peak / 1e6}
+        print('{:<30} {:>10.4f} s {:>10.2f} MB/s {:>12.1f} items/s {:>10.1f} MB peak'.format(
+            name, best, nbytes / 1e6 / best, nitems / best, peak / 1e6))
+    return results
+
+def compare(base_path, new_path, threshold):
+    """
+        Print the time ratio of every benchmark in both files, returns the
+        names slower by more than threshold
+    """
+    with open(base_path, 'r') as fin:
+        base = json.load(fin)
+    with open(new_path, 'r') as fin:
+        new = json.load(fin)
+
+    regressions = []
+    print('{} ({}) -> {} ({})'.format(base_path, base['environment']['commit'],
+                                      new_path, new['environment']['commit']))
+    if base['corpus'] != new['corpus']:
+        print('Warning: results of different corpora, {} vs {}'.format(base['corpus'], new['corpus']))
+    for name, result in sorted(new['benchmarks'].items()):
+        old = base['benchmarks'].get(name)
+        if old is None or 'seconds' not in old or 'seconds' not in result:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print('{:<30} {:>10.4f} s -> {:>10.4f} s {:>6.2f}x  peak {:>8.1f} -> {:>8.1f} MB {}'.format(
+            name, old['seconds'], result['seconds'], ratio, old['peak_mb'], result['peak_mb'], flag))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--out_file', type=str, default='benchmark.json', help='json results file')
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('BASE', 'NEW'), help='compare two results files')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown ratio reported as regression')
+    parser.add_argument('--only', type=str, nargs='+', choices=[name for name, _ in BENCHMARKS])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--corpus_dir', type=str, default='./synthetic')
+    parser.add_argument('--filings', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size_kb', type=int, default=300, help='median primary 10-K document size')
+    parser.add_argument('--index_rows', type=int, default=100000)
+    parser.add_argument('--model_dir', type=str, default='model')
+    parser.add_argument('--batch_size', type=int, default=128)
+    parser.add_argument('--encoder_lines', type=int, default=32,
+                        help='MD&A lines (paragraphs) transformed by the encoders')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+
+    results = run_benchmarks(args)
+    with open(args.out_file, 'w') as fout:
+        json.dump(results, fout, indent=2)
+    print('Results written to {}'.format(args.out_file))
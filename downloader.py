@@ -0,0 +1,131 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from executor import thread_imap
+
+# SEC fair access policy: at most 10 requests per second per host,
+# and requests must identify themselves with a User-Agent
+SEC_RATE_LIMIT = 10
+USER_AGENT = 'edgar-10k-sa research crawler (admin@localhost)'
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# The server asks every client to slow down, not just the request that got it
+PAUSE_STATUS = (429, 503)
+
+class RateLimiter(object):
+    """
+        Token bucket shared by every download thread
+    """
+    def __init__(self, rate=SEC_RATE_LIMIT, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                    self.last = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def pause(self, seconds):
+        """
+            Hold every token for seconds, the bucket refills from empty after
+        """
+        with self.lock:
+            until = time.monotonic() + seconds
+            if until > self.paused_until:
+                self.paused_until = until
+                self.tokens = 0
+                self.last = until
+
+class Downloader(object):
+    """
+        Thread pool downloader with one keep-alive connection pool,
+        a token bucket rate limiter and retries with exponential backoff
+    """
+    def __init__(self, rate=SEC_RATE_LIMIT, max_workers=16, max_retries=5,
+                 backoff=0.5, timeout=60, user_agent=USER_AGENT):
+        self.limiter = RateLimiter(rate)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, headers=None):
+        """
+            GET with rate limiting, retrying on 429/5xx and connection errors.
+            429 and 503 pause every thread for Retry-After (or the backoff).
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                r = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+            else:
+                if r.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return r
+                delay = self._retry_after(r) or self.backoff * 2 ** attempt
+                r.close()
+                if r.status_code in PAUSE_STATUS:
+                    # acquire() waits out the pause
+                    self.limiter.pause(delay)
+                    delay = 0
+            attempt += 1
+            if delay:
+                time.sleep(delay)
+
+    def fetch(self, url):
+        r = self.get(url)
+        r.raise_for_status()
+        return r.content
+
+    def imap(self, urls, report=None):
+        """
+            Yields (url, content) in completion order, keeping at most
+            max_workers requests in flight. Failed urls are skipped.
+            report(url, error, nbytes, seconds) is called for every url when given.
+        """
+        for url, content, error, seconds in thread_imap(self.fetch, urls, self.max_workers):
+            if error is not None:
+                if report is not None:
+                    report(url, error, None, seconds)
+                continue
+            if report is not None:
+                report(url, None, len(content), seconds)
+            yield url, content
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def _retry_after(r):
+        value = r.headers.get('Retry-After')
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
@@ -3,8 +3,8 @@ import numpy as np
 import tensorflow as tf
 
 from tqdm import tqdm
-from sklearn.externals import joblib
 
+from npencoder import ceil_round_step, batch_pad
 from utils import HParams, preprocess, iter_data
 
 global nloaded
@@ -100,21 +100,6 @@ def model(X, S, M=None, reuse=False):
     return cells, states, logits
 
 
-def ceil_round_step(n, step):
-    return int(np.ceil(n/step)*step)
-
-
-def batch_pad(xs, nbatch, nsteps):
-    xmb = np.zeros((nbatch, nsteps), dtype=np.int32)
-    mmb = np.ones((nbatch, nsteps, 1), dtype=np.float32)
-    for i, x in enumerate(xs):
-        l = len(x)
-        npad = nsteps-l
-        xmb[i, -l:] = list(x)
-        mmb[i, :npad] = 0
-    return xmb, mmb
-
-
 class Model(object):
 
     def __init__(self, nbatch=128, nsteps=64):
@@ -0,0 +1,118 @@
+"""
+    Bounded streaming of the pipeline stages over thread and process pools
+
+    thread_imap runs I/O (downloads) on threads, Executor.imap runs CPU work
+    (html parsing, MD&A extraction, scoring) on one shared process pool.
+    Both yield results in completion order and only take the next item of
+    their input when a slot frees up, so a slow stage holds back the one
+    feeding it instead of queueing every download or text in memory, and
+    stages chained as generators run concurrently.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import os
+import time
+
+from pathos.pools import ProcessPool
+from pathos.helpers import cpu_count
+
+# Seconds waited on the oldest pending task before checking the others
+POLL = 0.01
+
+def available_cpus():
+    """
+        Cpus this process may run on, less than cpu_count() under an affinity mask
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return cpu_count()
+
+def thread_imap(func, items, max_workers):
+    """
+        Yields (item, result, error, seconds) of func(item) in completion
+        order, keeping at most max_workers calls in flight
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+
+        def submit():
+            for item in items:
+                futures[executor.submit(func, item)] = (item, time.time())
+                return True
+            return False
+
+        for _ in range(max_workers):
+            if not submit():
+                break
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, started = futures.pop(future)
+                submit()
+                try:
+                    result, error = future.result(), None
+                except BaseException as e:
+                    result, error = None, e
+                yield item, result, error, time.time() - started
+
+class Executor(object):
+    """
+        Process pool shared by the stages of a run. Tasks are submitted one
+        at a time (apipe) from the thread iterating imap, at most max_pending
+        per imap, so any number of imap calls can stream through the pool
+        together.
+    """
+    def __init__(self, ncpus=None, max_pending=None):
+        self.ncpus = ncpus or available_cpus()
+        self.max_pending = max_pending or 2 * self.ncpus
+        self._pool = None
+
+    def __getstate__(self):
+        # Pickled along with the stage objects of worker closures
+        return {'ncpus': self.ncpus, 'max_pending': self.max_pending, '_pool': None}
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPool(self.ncpus)
+        return self._pool
+
+    def imap(self, func, jobs):
+        """
+            Yields func(job) of every job in completion order. The next job
+            is taken from jobs when fewer than max_pending are running or
+            waiting to be yielded.
+        """
+        jobs = iter(jobs)
+        pending = deque()
+        exhausted = False
+        while True:
+            for result in self._pop_ready(pending):
+                yield result
+
+            if not exhausted and len(pending) < self.max_pending:
+                for job in jobs:
+                    pending.append(self.pool.apipe(func, job))
+                    break
+                else:
+                    exhausted = True
+                continue
+
+            if not pending:
+                return
+            pending[0].wait(POLL)
+
+    @staticmethod
+    def _pop_ready(pending):
+        ready = [result for result in pending if result.ready()]
+        for result in ready:
+            pending.remove(result)
+        return [result.get() for result in ready]
+
+    def map(self, func, jobs):
+        """
+            func(job) of every job, in completion order
+        """
+        return list(self.imap(func, jobs))
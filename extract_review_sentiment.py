@@ -1,20 +1,116 @@
 import argparse
 from glob import glob
 import os
+import time
 
 import numpy as np
 from tqdm import tqdm
 
-from encoder import Model
+from metrics import Metrics
+
+# Sentiment neuron of the mLSTM
+NEURON = 2388
+
+def iter_file_lines(mda_files):
+    """
+        Yield (mda_file, non blank lines) of each file
+    """
+    for mda_file in mda_files:
+        with open(mda_file,'r') as fin:
+            text = fin.read()
+
+        yield mda_file, list(filter(lambda x: x.strip(), text.splitlines()))
+
+def neuron_values(model, file_lines, pool_lines, neuron=NEURON, metrics=None):
+    """
+        Yield (mda_file, neuron value of each line) in file order.
+        Lines of consecutive files are pooled into one transform call of
+        about pool_lines lines, which sorts them by length across files and
+        runs them in full model batches; the values are then split back by file.
+        Lines and seconds of each transform call are recorded to metrics.
+    """
+    pending = [] # [mda_file, values, number of lines] of files not yielded yet
+    pool = []
+    owners = [] # (values, number of lines) of each file segment in pool
+
+    def flush():
+        _start = time.time()
+        if getattr(model, 'cache', None) is not None:
+            # Only the neuron is looked up in / stored to the feature cache
+            features = model.transform(pool, [neuron])[:, 0]
+        else:
+            features = model.transform(pool)[:, neuron]
+        if metrics is not None:
+            seconds = time.time() - _start
+            metrics.inc('inference_lines_total', len(pool))
+            metrics.inc('inference_seconds_total', seconds)
+            metrics.observe('inference_pool_seconds', seconds)
+            metrics.observe('inference_pool_lines', len(pool))
+        offset = 0
+        for values, n in owners:
+            values += features[offset:offset+n].tolist()
+            offset += n
+        del pool[:]
+        del owners[:]
+
+    for mda_file, lines in file_lines:
+        values = []
+        pending.append((mda_file, values, len(lines)))
+        for start in range(0, len(lines), pool_lines):
+            segment = lines[start:start+pool_lines]
+            pool += segment
+            owners.append((values, len(segment)))
+            if len(pool) >= pool_lines:
+                flush()
+
+        while pending and len(pending[0][1]) == pending[0][2]:
+            mda_file, values, _ = pending.pop(0)
+            yield mda_file, values
+
+    if pool:
+        flush()
+    for mda_file, values, _ in pending:
+        yield mda_file, values
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--mda_dir', type=str, help="mda file directory")
     parser.add_argument('-b', '--batch_size', type=int,
-                        default=1024, help='batch size of model')
+                        default=None, help='batch size of model, default 1024 (numpy) or 128 (tf)')
+    parser.add_argument('-p', '--pool_lines', type=int,
+                        default=8192, help='lines of consecutive files transformed together')
     parser.add_argument('-o', '--out_file', type=str, help='out file name')
+    parser.add_argument('-e', '--engine', type=str, default='numpy', choices=['numpy', 'tf'],
+                        help='numpy inference (npencoder) or the TensorFlow graph (encoder)')
+    parser.add_argument('--precision', type=str, default='float32', choices=['float32', 'bfloat16', 'int8'],
+                        help='storage of the recurrent weights (numpy engine), see precision_report.py')
+    parser.add_argument('-c', '--feature_cache', type=str,
+                        help='sqlite file caching the neuron value of each distinct line (numpy engine)')
+    parser.add_argument('--cache_states', action='store_true',
+                        help='cache the full state of each line instead of the neuron only')
+    parser.add_argument('--cache_entries', type=int, default=10000000,
+                        help='lines kept in the feature cache, least recently used are evicted')
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help='Prometheus textfile of inference lines, seconds and pool sizes')
     args = parser.parse_args()
 
+    if args.engine == 'numpy':
+        from npencoder import Model
+    else:
+        from encoder import Model
+        if args.feature_cache:
+            parser.error('--feature_cache needs --engine numpy')
+        if args.precision != 'float32':
+            parser.error('--precision needs --engine numpy')
+
+    cache = None
+    if args.feature_cache:
+        from featurecache import FeatureCache
+        from npencoder import model_key
+        cache = FeatureCache(args.feature_cache, model_key(),
+                             indexes=None if args.cache_states else [NEURON],
+                             max_entries=args.cache_entries)
+
     mda_files = glob(os.path.join(args.mda_dir, '*.mda'))
     batch_size = args.batch_size
     out_file = args.out_file
@@ -24,24 +120,18 @@ if __name__ == "__main__":
     fout.write(','.join(header)+'\n')
 
 
-    model = Model()
+    if args.engine == 'numpy':
+        model = Model(nbatch=batch_size or 1024, cache=cache, precision=args.precision)
+    elif batch_size:
+        model = Model(nbatch=batch_size)
+    else:
+        # The TensorFlow graph keeps its own default
+        model = Model()
 
-    for mda_file in tqdm(mda_files):
-        
-        with open(mda_file,'r') as fin:
-            text = fin.read()
-        
-        lines = list(filter(lambda x: x.strip(), text.splitlines()))
-
-        feature_list = []
-
-        for idx in tqdm(range(0, len(lines), batch_size)):
-            line_list = lines[idx:idx+batch_size]
+    metrics = Metrics(textfile=args.metrics_file)
+    file_values = neuron_values(model, iter_file_lines(mda_files), args.pool_lines, metrics=metrics)
+    for mda_file, feature_list in tqdm(file_values, total=len(mda_files)):
 
-            features = model.transform(line_list)
-
-            feature_list += features[:,2388].tolist()
-        
         mean = np.mean(feature_list)
         std = np.std(feature_list)
 
@@ -54,3 +144,12 @@ if __name__ == "__main__":
         fout.write(','.join(row)+'\n')
 
     fout.close()
+
+    metrics.close()
+    print('{} lines at {:.1f} lines/sec'.format(
+        metrics.value('inference_lines_total'),
+        metrics.value('inference_lines_total') / max(metrics.value('inference_seconds_total'), 1e-9)))
+
+    if cache is not None:
+        print(cache.stats())
+        cache.close()
@@ -0,0 +1,131 @@
+"""
+    Persistent cache of mLSTM features per preprocessed line
+
+    MD&A sections repeat boilerplate lines across years and filers, a line
+    seen before is looked up instead of run through the model again.
+    Features are stored as float32 blobs in sqlite, keyed by a hash of the
+    preprocessed line bytes, with least recently used entries evicted
+    past max_entries.
+"""
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+
+# Keys looked up per sqlite statement
+QUERY_SIZE = 500
+
+def line_key(x):
+    """
+        Key of a preprocessed line (bytes)
+    """
+    return hashlib.blake2b(x, digest_size=16).digest()
+
+class FeatureCache(object):
+    """
+        model_key identifies the weights, indexes the stored feature columns
+        (None for the full state). A cache built for other weights or
+        columns is cleared on open.
+    """
+    def __init__(self, path, model_key, indexes=None, max_entries=10000000):
+        self.path = path
+        self.indexes = None if indexes is None else list(indexes)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS features (key BLOB PRIMARY KEY, features BLOB, used INTEGER)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS features_used ON features (used)')
+
+        meta = json.dumps({'model': model_key, 'indexes': self.indexes})
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'meta'").fetchone()
+        if row is None or row[0] != meta:
+            self.conn.execute('DELETE FROM features')
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('meta', ?)", (meta,))
+        self.conn.commit()
+
+        # Recency counter, larger is more recently used
+        self.clock = self.conn.execute('SELECT COALESCE(MAX(used), 0) FROM features').fetchone()[0]
+        # Rows in the table, kept up to date by _put and _evict
+        self.count = self.conn.execute('SELECT COUNT(*) FROM features').fetchone()[0]
+
+    def covers(self, indexes):
+        """
+            True if features at indexes (None for all) can be served
+        """
+        return self.indexes is None or (indexes is not None and list(indexes) == self.indexes)
+
+    def _get(self, keys):
+        found = {}
+        for i in range(0, len(keys), QUERY_SIZE):
+            chunk = keys[i:i+QUERY_SIZE]
+            rows = self.conn.execute(
+                'SELECT key, features FROM features WHERE key IN ({})'.format(','.join('?' * len(chunk))), chunk)
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _put(self, items):
+        # Only keys missing from the table are put, every row is new
+        rows = [(key, np.asarray(f, dtype=np.float32).tobytes(), self.clock) for key, f in items]
+        self.conn.executemany('INSERT OR REPLACE INTO features VALUES (?, ?, ?)', rows)
+        self.count += len(rows)
+
+    def _touch(self, keys):
+        self.conn.executemany('UPDATE features SET used = ? WHERE key = ?', [(self.clock, key) for key in keys])
+
+    def _evict(self):
+        if self.count > self.max_entries:
+            cursor = self.conn.execute('DELETE FROM features WHERE key IN '
+                                       '(SELECT key FROM features ORDER BY used LIMIT ?)',
+                                       (self.count - self.max_entries,))
+            self.count -= cursor.rowcount
+
+    def features(self, xs, compute, indexes=None):
+        """
+            Features at indexes of preprocessed lines xs. compute(lines) gives
+            the full features of lines, it is only run on distinct lines not
+            in the cache.
+        """
+        self.clock += 1
+        keys = [line_key(x) for x in xs]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self._get(unique_keys)
+
+        missing = {}
+        for key, x in zip(keys, xs):
+            if key not in found:
+                missing.setdefault(key, x)
+        nmissing = sum(1 for key in keys if key in missing)
+        self.hits += len(keys) - nmissing
+        self.misses += nmissing
+
+        self._touch(list(found))
+        if missing:
+            computed = compute(list(missing.values()))
+            if self.indexes is not None:
+                computed = computed[:, self.indexes]
+            self._put(zip(missing, computed))
+            found.update(zip(missing, computed))
+            self._evict()
+        self.conn.commit()
+
+        features = np.stack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        if indexes is not None and self.indexes is None:
+            features = features[:, indexes]
+        return features
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        size = self.count
+        return 'feature cache {}: {} hits, {} misses, hit rate {:.1%}, {} entries'.format(
+            self.path, self.hits, self.misses, self.hit_rate(), size)
+
+    def close(self):
+        self.conn.close()
@@ -1,100 +1,294 @@
 import codecs
-import csv
 from glob import glob
 import os
 import re
 import sys
-import unicodedata
+import time
 
-from bs4 import BeautifulSoup
-from pathos.pools import ProcessPool
-from pathos.helpers import cpu_count
-import requests
+from downloader import Downloader
+from executor import Executor
+from metrics import Metrics, timed
+import htmltext
+from jobstate import SUCCESS, FAILED
+from normalizer import process_text
+from rawcache import accession_number
 
 SEC_GOV_URL = 'http://www.sec.gov/Archives'
 
+# <TYPE> prefixes of documents kept from a submission
+FORM_10K_PREFIX = b'10-K' # 10-K, 10-K405, 10-KSB, 10-KT, 10-K/A ...
+ANNUAL_REPORT_PREFIX = b'EX-13' # Annual report to shareholders
+
+DOCUMENT_BEGIN = b'<DOCUMENT>'
+DOCUMENT_END = b'</DOCUMENT>'
+DOCUMENT_TYPE = re.compile(rb'<TYPE>[ \t]*([^\s<]+)')
+
+# MD&A incorporated by reference from the annual report (EX-13), said in
+# the paragraphs right after the ITEM 7 header, before any other ITEM header
+MDA_BY_REFERENCE = re.compile(r'\nITEM 7[^A0-9](?:[^\n]|\n(?!ITEM)){0,600}?INCORPORATED\s+(?:HEREIN\s+)?BY\s+REFERENCE')
+
+# The annual report has no ITEM headers, its MD&A starts at this heading
+# and ends at the next of the headings that usually follow it
+MDA_HEADING = re.compile(r"\nMANAGEMENT(?:'|\u2019|`)?S\s+DISCUSSION\s+AND\s+ANALYSIS")
+MDA_HEADING_ENDS = re.compile(r"\n(?:QUANTITATIVE\s+AND\s+QUALITATIVE\s+DISCLOSURES?"
+                              r"|MANAGEMENT(?:'|\u2019|`)?S\s+(?:ANNUAL\s+)?REPORT"
+                              r"|REPORT\s+OF\s+INDEPENDENT"
+                              r"|CONSOLIDATED\s+(?:BALANCE\s+SHEETS?|STATEMENTS?\s+OF)"
+                              r"|SELECTED\s+(?:CONSOLIDATED\s+)?FINANCIAL\s+DATA)")
+
+# Shorter sections found at a heading are taken for a table of contents entry
+MIN_MDA_SIZE = 1000
+
+def find_exhibit_mda(text):
+    """
+        MD&A section of a processed annual report text, "" if not found
+    """
+    for heading in MDA_HEADING.finditer(text):
+        end = MDA_HEADING_ENDS.search(text, heading.end())
+        mda = text[heading.start():end.start() if end else len(text)].strip()
+        if len(mda) >= MIN_MDA_SIZE:
+            return mda
+    return ""
+
+def split_submission(content, types=(FORM_10K_PREFIX, ANNUAL_REPORT_PREFIX)):
+    """
+        Split an EDGAR .txt submission into [(type, document bytes)], keeping only
+        documents whose <TYPE> starts with one of types. Other documents (exhibits,
+        XBRL, uuencoded graphics/pdfs) are skipped without being decoded.
+        Content without <DOCUMENT> sections is returned whole as one document.
+    """
+    documents = []
+    pos = content.find(DOCUMENT_BEGIN)
+    if pos == -1:
+        return [(FORM_10K_PREFIX, content)]
+
+    while pos != -1:
+        end = content.find(DOCUMENT_END, pos)
+        end = len(content) if end == -1 else end + len(DOCUMENT_END)
+
+        # <TYPE> is in the document header, before <TEXT>
+        match = DOCUMENT_TYPE.search(content, pos, min(end, pos + 1024))
+        doc_type = match.group(1).upper() if match else b''
+        if doc_type.startswith(types):
+            documents.append((doc_type, content[pos:end]))
+
+        pos = content.find(DOCUMENT_BEGIN, end)
+
+    return documents
+
 class Form10k(object):
-    def __init__(self, txt_dir):
-        # Save to txt dir
-        self.txt_dir = './txt'
-        if not os.path.exists(self.txt_dir):
-            os.makedirs(self.txt_dir)
+    def __init__(self, txt_dir, archive_url=SEC_GOV_URL, html_backend=None, raw_cache=None, job_state=None,
+                 ncpus=None, executor=None, metrics=None):
+        self.archive_url = archive_url
+        self.html_backend = html_backend or htmltext.default_backend()
+        # Raw submissions are read from and saved to this RawCache when given
+        self.raw_cache = raw_cache
+        # Download and text results are recorded to this jobstate.JobState when given
+        self.job_state = job_state
+        # Parsing runs on this executor.Executor, shared with the other stages when given
+        self.executor = executor or Executor(ncpus)
+        # Download and parsing timings are recorded to this metrics.Metrics
+        self.metrics = metrics or Metrics()
+
+        # Save to txt dir, created when the first texts are written
+        self.txt_dir = txt_dir
+        # Accession numbers of the texts the last download / reprocess (re)writes
+        self.writing = set()
+
+    def __getstate__(self):
+        # Pickled into every parsing task, which never reads writing
+        state = dict(self.__dict__)
+        state['writing'] = set()
+        return state
 
     def _process_text(self, text):
         """
             Preprocess Text
         """
-        text = unicodedata.normalize("NFKD", text) # Normalize
-        text = '\n'.join(text.splitlines()) # Let python take care of unicode break lines
+        return process_text(text)
 
-        # Convert to upper
-        text = text.upper() # Convert to upper
+    def download(self, records, downloader=None, retry=()):
+        """
+            Download the filings of index records (formindex.IndexRecord).
+            Downloads run on a rate limited thread pool sharing one connection
+            pool, parsing runs on a process pool fed with the downloaded content.
+            Submissions found in the raw cache are not downloaded again.
+            With a job state, filings whose text stage is recorded are skipped
+            unless their status is in retry, else existing texts are skipped.
+        """
+        for _ in self.iter_download(records, downloader, retry):
+            pass
 
-        # Take care of breaklines & whitespaces combinations due to beautifulsoup parsing
-        text = re.sub(r'[ ]+\n', '\n', text)
-        text = re.sub(r'\n[ ]+', '\n', text)
-        text = re.sub(r'\n+', '\n', text)
+    def iter_download(self, records, downloader=None, retry=()):
+        """
+            download, yielding the name of each text in txt_dir as it is written
+        """
+        finished = set()
+        if self.job_state is not None:
+            finished = self.job_state.finished('text', retry)
 
-        # To find MDA section, reformat item headers
-        text = text.replace('\n.\n','.\n') # Move Period to beginning
+        urls = []
+        names = []
+        for rec in records:
+            url = os.path.join(self.archive_url,rec.filename)
+            names.append(self._name(url))
+            if self.job_state is not None:
+                if accession_number(url) in finished:
+                    continue
+            elif os.path.exists(self._text_path(url)):
+                continue
+            urls.append(url)
 
-        text = text.replace('\nI\nTEM','\nITEM')
-        text = text.replace('\nITEM\n','\nITEM ')
-        text = text.replace('\nITEM  ','\nITEM ')
+        if self.job_state is not None:
+            self.job_state.register(names)
+        self.writing = set(accession_number(url) for url in urls)
+        if len(names) > len(urls):
+            print("Skipping {} filings already processed".format(len(names) - len(urls)))
+            self.metrics.inc('skipped_total', len(names) - len(urls), stage='text')
 
-        text = text.replace(':\n','.\n')
+        return self._iter_parsing(self._fetch_jobs(urls, downloader))
 
-        # Math symbols for clearer looks
-        text = text.replace('$\n','$')
-        text = text.replace('\n%','%')
+    def reprocess(self, records):
+        """
+            Rebuild txt_dir from the raw cache without touching the network
+        """
+        for _ in self.iter_reprocess(records):
+            pass
 
-        # Reformat
-        text = text.replace('\n','\n\n') # Reformat by additional breakline
+    def iter_reprocess(self, records):
+        """
+            reprocess, yielding the name of each text in txt_dir as it is written
+        """
+        if self.raw_cache is None:
+            raise ValueError("reprocess requires a raw cache")
 
-        return text
+        urls = [os.path.join(self.archive_url,rec.filename) for rec in records]
+        if self.job_state is not None:
+            self.job_state.register([self._name(url) for url in urls])
+        urls = [url for url in urls if accession_number(url) in self.raw_cache]
+        self.writing = set(accession_number(url) for url in urls)
+        print("Reprocessing {} cached submissions".format(len(urls)))
+        return self._iter_parsing((url, None) for url in urls)
 
+    def _fetch_jobs(self, urls, downloader=None):
+        """
+            (url, content) jobs for urls, cached submissions come first with
+            content None and are read by the parsing workers (_load)
+        """
+        cached = []
+        if self.raw_cache is not None:
+            cached = [url for url in urls if accession_number(url) in self.raw_cache]
+            cached_set = set(cached)
+            urls = [url for url in urls if url not in cached_set]
 
-    def download(self, index_path):
+        for job in ((url, None) for url in cached):
+            yield job
 
-        def iter_path_generator(index_path):
-            with open(index_path,'r') as fin:
-                reader = csv.reader(fin,delimiter=',',quotechar='\"',quoting=csv.QUOTE_ALL)
-                for row in reader:
-                    form_type, company_name, cik, date_filed, filename = row
-                    url = os.path.join(SEC_GOV_URL,filename)
-                    yield url
+        # A downloader made here is closed with its session when the jobs end
+        owned = downloader is None
+        if owned:
+            downloader = Downloader()
+        try:
+            for job in downloader.imap(urls, self._report_download):
+                yield job
+        finally:
+            if owned:
+                downloader.close()
 
-        def download_job(url):
-            fname = '_'.join(url.split('/')[-2:])
+    def _report_download(self, url, error, nbytes, seconds):
+        status = SUCCESS if error is None else FAILED
+        error = None if error is None else str(error)
+        self.metrics.record('download', self._name(url), status, error,
+                            download_seconds=seconds, download_bytes=nbytes)
+        if self.job_state is not None:
+            self.job_state.record(accession_number(url), 'download', status, error, nbytes, seconds)
 
-            fname, ext = os.path.splitext(fname)
-            htmlname = fname + '.html'
+    def _load(self, url, content):
+        """
+            Read a submission from the raw cache (content None) or save it there
+        """
+        accession = accession_number(url)
+        if content is None:
+            return self.raw_cache.get(accession)
+        if self.raw_cache is not None:
+            self.raw_cache.put(accession, content)
+        return content
 
-            text_path = os.path.join(self.txt_dir,fname + '.txt')
+    def _iter_parsing(self, jobs):
+        if not os.path.exists(self.txt_dir):
+            os.makedirs(self.txt_dir)
 
-            if os.path.exists(text_path):
-                print("Already exists, skipping {}".format(url))
-            else:
-                print("Downloading & Parsing {}".format(url))
+        def parsing_job(args):
+            url, content = args
+            timings = {}
+            _start = time.time()
+            try:
+                content = self._load(url, content)
+
+                # Parse the 10-K body to processed text
+                text = self._parse_submission(content, timings)
+
+                # Write to file
+                text_path = self._text_path(url)
+                with codecs.open(text_path,'w',encoding='utf-8') as fout:
+                    fout.write(text)
+            except BaseException as e:
+                return url, FAILED, str(e), None, time.time() - _start, timings
+            return url, SUCCESS, None, os.path.getsize(text_path), time.time() - _start, timings
 
-                r = requests.get(url)
-                try:
-                    # Parse html with Beautiful Soup
-                    soup = BeautifulSoup( r.content, "html.parser" )
-                    text = soup.get_text("\n")
+        # Failures are counted by the metrics and their errors are in the events
+        for url, status, error, nbytes, seconds, timings in self.executor.imap( parsing_job, jobs ):
+            self.metrics.record('text', self._name(url), status, error,
+                                text_seconds=seconds, text_bytes=nbytes, **timings)
+            if self.job_state is not None:
+                self.job_state.record(accession_number(url), 'text', status, error, nbytes, seconds)
+            if status == SUCCESS:
+                yield self._name(url) + '.txt'
 
-                    # Process Text
-                    text = self._process_text(text)
+    def _parse_submission(self, content, timings=None):
+        """
+            Parse only the primary 10-K document of a submission. When its
+            MD&A is incorporated by reference, the MD&A of the EX-13 annual
+            report is inserted after the ITEM 7 paragraph that says so, where
+            MDAParser finds it.
+            Seconds spent in html_seconds / normalize_seconds are added to timings.
+        """
+        if timings is None:
+            timings = {}
+        documents = split_submission(content)
+        forms = [doc for doc_type, doc in documents if doc_type.startswith(FORM_10K_PREFIX)]
+        exhibits = [doc for doc_type, doc in documents if doc_type.startswith(ANNUAL_REPORT_PREFIX)]
+        if not forms:
+            # Unexpected main document type, keep the old behaviour of parsing everything
+            forms, exhibits = [content], []
 
-                    text_path = os.path.join(self.txt_dir,fname + '.txt')
-                    # Write to file
-                    with codecs.open(text_path,'w',encoding='utf-8') as fout:
-                        fout.write(text)
-                except BaseException as e:
-                    print("{} parsing failed: {}".format(url,e))
+        with timed(timings, 'html_seconds'):
+            form_text = htmltext.get_text(forms[0], self.html_backend)
+        with timed(timings, 'normalize_seconds'):
+            text = self._process_text(form_text)
+
+        reference = MDA_BY_REFERENCE.search(text) if exhibits else None
+        if reference:
+            with timed(timings, 'html_seconds'):
+                exhibit_texts = [htmltext.get_text(doc, self.html_backend) for doc in exhibits]
+            with timed(timings, 'normalize_seconds'):
+                exhibit_text = self._process_text('\n'.join(exhibit_texts))
+            mda = find_exhibit_mda(exhibit_text)
+            if mda:
+                pos = text.find('\n', reference.end())
+                pos = len(text) if pos == -1 else pos
+                text = text[:pos] + '\n\n' + mda + text[pos:]
+            else:
+                # No MD&A heading, keep the whole annual report
+                text = text + '\n\n' + exhibit_text
+
+        return text
 
+    def _name(self, url):
+        # <cik>_<accession>
+        fname = '_'.join(url.split('/')[-2:])
+        fname, ext = os.path.splitext(fname)
+        return fname
 
-        ncpus = cpu_count() if cpu_count() <= 8 else 8;
-        pool = ProcessPool( ncpus )
-        pool.map( download_job,
-                    iter_path_generator(index_path) )
+    def _text_path(self, url):
+        return os.path.join(self.txt_dir,self._name(url) + '.txt')
@@ -1,16 +1,40 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import csv
+from email.utils import formatdate
+import gzip
+import json
 import os
 
-import requests
+import numpy as np
+
+from downloader import Downloader
 
 SEC_GOV_URL = 'http://www.sec.gov/Archives'
-FORM_INDEX_URL = os.path.join(SEC_GOV_URL,'edgar','full-index','{}','QTR{}','form.idx')
+FORM_INDEX_PATH = os.path.join('edgar','full-index','{}','QTR{}','form.{}')
 IndexRecord = namedtuple("IndexRecord",["form_type","company_name","cik","date_filed","filename"])
 
+# Annual report form types, amendments excluded
+FORM_10K_TYPES = ['10-K','10-K405','10-KSB','10-KSB40','10-KT','10-KT405']
+
+# Columnar layout of the parsed index, one structured array per quarter
+INDEX_DTYPE = np.dtype([('form_type','S20'),
+                        ('company_name','S150'),
+                        ('cik','i8'),
+                        ('date_filed','M8[D]'),
+                        ('filename','S80')])
+
+# Statuses of a quarter that is not published yet
+NOT_PUBLISHED_STATUS = (403, 404)
+
+class IndexNotPublished(Exception):
+    pass
+
 class FormIndex(object):
-    def __init__(self, index_dir):
-        self.formrecords = []
+    def __init__(self, index_dir, archive_url=SEC_GOV_URL, downloader=None):
+        self.quarters = {}
+        self.archive_url = archive_url
+        self.downloader = downloader
 
         self.index_dir = index_dir
         if not os.path.exists(index_dir):
@@ -18,66 +42,294 @@ class FormIndex(object):
 
     def retrieve(self, year, qtr):
 
-        form_idx = "form_year{}_qtr{}.index".format(year,qtr)
-        form_idx_path = os.path.join(self.index_dir,form_idx)
+        form_idx_path = self._index_path(year, qtr)
 
-        self.download(form_idx_path, year, qtr)
-        self.extract(form_idx_path)
+        try:
+            previous = self.download(form_idx_path, year, qtr)
+        except IndexNotPublished:
+            # Keep a stored index, else the quarter has no filings yet
+            if not os.path.exists(form_idx_path):
+                return
+            previous = None
+        self.quarters[(year,qtr)] = self.extract(form_idx_path, previous)
+
+    def load_all(self, periods):
+        """
+            Use the (year, qtr) quarters stored in index_dir without
+            refreshing them, quarters never retrieved are skipped
+        """
+        for year, qtr in periods:
+            form_idx_path = self._index_path(year, qtr)
+            if not os.path.exists(form_idx_path):
+                print("Index not stored: year {}, qtr {}".format(year,qtr))
+                continue
+            self.quarters[(year,qtr)] = self.extract(form_idx_path)
+
+    def _index_path(self, year, qtr):
+        return os.path.join(self.index_dir,"form_year{}_qtr{}.index".format(year,qtr))
+
+    def retrieve_all(self, periods, max_workers=8):
+        """
+            Retrieve many (year, qtr) quarters concurrently
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(lambda period: self.retrieve(*period), periods):
+                pass
 
     def download(self, form_idx_path, year, qtr):
+        """
+            Conditional GET of the gzip compressed quarterly index.
+            Returns the previous index content when the index was updated,
+            None when it is unchanged or downloaded for the first time.
+            Raises IndexNotPublished for a quarter SEC does not serve (yet).
+        """
+        if self.downloader is None:
+            self.downloader = Downloader()
+
+        meta_path = form_idx_path + '.json'
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path,'r') as fin:
+                meta = json.load(fin)
+
+        headers = {}
         if os.path.exists(form_idx_path):
-            print("Download skipped: year {}, qtr {}".format(year,qtr))
-            return
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            headers['If-Modified-Since'] = meta.get('last_modified') or \
+                formatdate(os.path.getmtime(form_idx_path), usegmt=True)
 
-        # Download and save to cached directory
         print("Downloading year {}, qtr {}".format(year,qtr))
+        # Try the variant that worked last time first
+        exts = ['gz','idx']
+        if meta.get('ext') in exts:
+            exts.sort(key=lambda ext: ext != meta['ext'])
+        for ext in exts:
+            index_url = os.path.join(self.archive_url,FORM_INDEX_PATH.format(year,qtr,ext))
+            resp = self.downloader.get(index_url, headers=headers)
+            if resp.status_code not in NOT_PUBLISHED_STATUS:
+                break
+
+        if resp.status_code in NOT_PUBLISHED_STATUS:
+            print("Index not published: year {}, qtr {}".format(year,qtr))
+            raise IndexNotPublished(index_url)
 
-        index_url = FORM_INDEX_URL.format(year,qtr)
-        resp = requests.get(index_url)
+        if resp.status_code == 304:
+            print("Index unchanged: year {}, qtr {}".format(year,qtr))
+            if meta.get('ext') != ext:
+                meta['ext'] = ext
+                write_atomic(meta_path, lambda fout: json.dump(meta, fout), 'w')
+            return None
+        resp.raise_for_status()
 
-        with open(form_idx_path,'wb') as fout:
-            fout.write(resp.content)
+        content = resp.content
+        if content[:2] == b'\x1f\x8b':
+            content = gzip.decompress(content)
 
-    def extract(self, form_idx_path):
-        # Parse row to record
-        def parse_row_to_record(row, fields_begin):
-            record = []
+        previous = None
+        if os.path.exists(form_idx_path):
+            with open(form_idx_path,'rb') as fin:
+                previous = fin.read()
 
-            for begin, end in zip(fields_begin[:],fields_begin[1:] + [len(row)] ):
-                field = row[begin:end].rstrip()
-                field = field.strip('\"')
-                record.append(field)
+        meta = {'ext': ext,
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified')}
+        write_atomic(form_idx_path, lambda fout: fout.write(content))
+        write_atomic(meta_path, lambda fout: json.dump(meta, fout), 'w')
 
-            return record
+        return previous
 
-        # Read and parse
-        print("Extracting from {}".format(form_idx_path))
+    def extract(self, form_idx_path, previous=None):
+        """
+            Parse every row of form.idx into an INDEX_DTYPE array, cached
+            next to the index file so each quarter is only parsed once.
+            When the previous index content is given, only rows added since
+            are parsed and appended to the cached array.
+        """
+        store_path = os.path.splitext(form_idx_path)[0] + '.npy'
+        if os.path.exists(store_path) and \
+           os.path.getmtime(store_path) >= os.path.getmtime(form_idx_path):
+            return np.load(store_path)
 
         with open(form_idx_path,'rb') as fin:
-            # If arrived at 10-K section of forms
-            arrived = False
-
-            for row in fin.readlines():
-                row = row.decode('ascii')
-                if row.startswith("Form Type"):
-                    fields_begin = [ row.find("Form Type"),
-                                     row.find("Company Name"),
-                                     row.find('CIK'),
-                                     row.find('Date Filed'),
-                                     row.find("File Name") ]
-
-                elif row.startswith("10-K "):
-                    arrived = True
-                    rec = parse_row_to_record(row,fields_begin)
-                    self.formrecords.append(IndexRecord(*rec))
-
-                elif arrived == True:
-                    break
-
-    def save(self, path):
+            data = fin.read()
+
+        records = None
+        if previous is not None and os.path.exists(store_path):
+            head, lines = split_form_index(data)
+            _, old_lines = split_form_index(previous)
+            old_lines = set(old_lines)
+            new_lines = [line for line in lines if line not in old_lines]
+            # Rows removed from the index need a full parse
+            if len(lines) - len(new_lines) == len(old_lines):
+                print("Extracting {} new rows from {}".format(len(new_lines),form_idx_path))
+                new_records = parse_form_index(head + b'\n'.join(new_lines))
+                records = np.concatenate([np.load(store_path), new_records])
+
+        if records is None:
+            print("Extracting from {}".format(form_idx_path))
+            records = parse_form_index(data)
+
+        write_atomic(store_path, lambda fout: np.save(fout, records))
+        return records
+
+    @property
+    def records(self):
+        if not self.quarters:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.concatenate([self.quarters[k] for k in sorted(self.quarters)])
+
+    def select(self, form_types=None, cik=None, date_start=None, date_end=None, company=None):
+        """
+            Filter records by form types, CIK(s), filing date range [date_start, date_end]
+            and case insensitive company name substring
+        """
+        records = self.records
+        mask = np.ones(len(records), dtype=bool)
+
+        if form_types is not None:
+            mask &= np.isin(records['form_type'], [f.encode('ascii') for f in form_types])
+        if cik is not None:
+            mask &= np.isin(records['cik'], np.atleast_1d(cik).astype('i8'))
+        if date_start is not None:
+            mask &= records['date_filed'] >= np.datetime64(date_start, 'D')
+        if date_end is not None:
+            mask &= records['date_filed'] <= np.datetime64(date_end, 'D')
+        if company is not None:
+            names = np.char.upper(records['company_name'])
+            mask &= np.char.find(names, company.upper().encode('ascii')) >= 0
+
+        return records[mask]
+
+    def save(self, path, records=None):
         print("Saving records to {}".format(path))
 
+        records = self.records if records is None else records
         with open(path,'w') as fout:
             writer = csv.writer(fout,delimiter=',',quotechar='\"',quoting=csv.QUOTE_ALL)
-            for rec in self.formrecords:
+            for rec in iter_records(records):
                 writer.writerow( tuple(rec) )
+
+def write_atomic(path, write, mode='wb'):
+    """
+        Write path through a temporary file, so processes sharing the
+        index directory (run.py --shard) never read a partial file
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, mode) as fout:
+        write(fout)
+    os.replace(tmp_path, path)
+
+def iter_records(records):
+    """
+        Yield IndexRecord with str fields from an INDEX_DTYPE array
+    """
+    for form_type, company_name, cik, date_filed, filename in records.tolist():
+        yield IndexRecord(form_type.decode('latin-1'),
+                          company_name.decode('latin-1'),
+                          str(cik),
+                          str(date_filed),
+                          filename.decode('latin-1'))
+
+def split_form_index(data):
+    """
+        Split form.idx content into the header block (up to and including the
+        dashed separator line) and the list of non empty row lines
+    """
+    # Header row starts a line, the description line also mentions "Form Type"
+    header = data.find(b'\nForm Type') + 1
+    if header == 0:
+        return b'', []
+
+    # Skip the dashed separator line
+    header_end = data.find(b'\n', header)
+    body = data.find(b'\n', header_end + 1) + 1
+    lines = [line for line in data[body:].splitlines() if line.strip()]
+    return data[:body], lines
+
+def parse_form_index(data):
+    """
+        Parse the fixed width rows of a form.idx file with column slicing
+        on a (rows x width) byte matrix instead of per row python code
+    """
+    head, lines = split_form_index(data)
+    if not lines:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+
+    header = head.find(b'\nForm Type') + 1
+    row = head[header:head.find(b'\n', header)]
+    fields_begin = [ row.find(b"Form Type"),
+                     row.find(b"Company Name"),
+                     row.find(b'CIK'),
+                     row.find(b'Date Filed'),
+                     row.find(b"File Name") ]
+
+    rows = np.array(lines)
+    width = rows.dtype.itemsize
+    matrix = rows.view(np.uint8).reshape(len(rows), width)
+
+    columns = []
+    for begin, end in zip(fields_begin, fields_begin[1:] + [width]):
+        columns.append(_column(matrix[:, begin:end]))
+    form_type, company_name, cik, date_filed, filename = columns
+
+    records = np.zeros(len(rows), dtype=INDEX_DTYPE)
+    records['form_type'] = form_type
+    records['company_name'] = company_name
+    records['cik'] = cik.astype('i8')
+    records['date_filed'] = _dates(date_filed)
+    records['filename'] = filename
+    return records
+
+# Bytes str.rstrip() removes from a decoded row, and the NUL padding of the matrix
+_STRIP_BYTES = np.zeros(256, dtype=bool)
+_STRIP_BYTES[list(b' \t\n\x0b\x0c\r\x1c\x1d\x1e\x1f\x00')] = True
+
+def _column(matrix):
+    """
+        field.rstrip().strip('"') of every row of a byte matrix column
+    """
+    width = matrix.shape[1]
+    positions = np.arange(width)
+
+    # rstrip
+    content = ~_STRIP_BYTES[matrix]
+    end = width - np.argmax(content[:, ::-1], axis=1)
+    end[~content.any(axis=1)] = 0
+
+    # strip('"') at both ends of what is left, quotes are rare and few
+    rows = np.arange(len(matrix))
+    quote = ord('"')
+    while True:
+        trailing = np.flatnonzero((end > 0) & (matrix[rows, np.maximum(end - 1, 0)] == quote))
+        if not len(trailing):
+            break
+        end[trailing] -= 1
+    begin = np.zeros(len(matrix), dtype=end.dtype)
+    while True:
+        leading = np.flatnonzero((begin < end) & (matrix[rows, np.minimum(begin, width - 1)] == quote))
+        if not len(leading):
+            break
+        begin[leading] += 1
+
+    column = matrix.copy()
+    # Shift the few fields with leading quotes to the start of their row
+    shifted = np.flatnonzero(begin)
+    if len(shifted):
+        index = np.minimum(begin[shifted, None] + positions, width - 1)
+        column[shifted] = np.take_along_axis(matrix[shifted], index, axis=1)
+    column[positions >= (end - begin)[:, None]] = 0
+    return np.ascontiguousarray(column).view('S{}'.format(width)).ravel()
+
+def _dates(column):
+    # Early indexes use YYYYMMDD instead of YYYY-MM-DD
+    matrix = column.astype('S10').view(np.uint8).reshape(len(column), 10)
+    compact = matrix[:, 4] != ord('-')
+    if compact.any():
+        dashed = np.full((compact.sum(), 10), ord('-'), dtype=np.uint8)
+        dashed[:, 0:4] = matrix[compact, 0:4]
+        dashed[:, 5:7] = matrix[compact, 4:6]
+        dashed[:, 8:10] = matrix[compact, 6:8]
+        matrix = matrix.copy()
+        matrix[compact] = dashed
+    return matrix.view('S10').ravel().astype('U10').astype('M8[D]')
@@ -0,0 +1,126 @@
+"""
+    HTML to text extraction backends
+
+    Every backend returns the text nodes of the document joined by '\\n',
+    the same output as BeautifulSoup(content, "html.parser").get_text("\\n")
+    that Form10k._process_text and MDAParser.parse_mda are tuned for.
+
+    lxml : libxml2 parser fed in chunks through a target, no tree is built
+    bs4  : reference BeautifulSoup "html.parser" implementation
+"""
+import sys
+import time
+
+CHUNK_SIZE = 1 << 20
+
+# BeautifulSoup does not return the content of these tags from get_text
+SKIP_TAGS = frozenset(['script', 'style', 'template'])
+
+def decode(content):
+    """
+        Decode bytes the way BeautifulSoup falls back without chardet
+    """
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('windows-1252', errors='replace')
+
+class _TextTarget(object):
+    """
+        lxml parser target collecting text nodes between tag boundaries
+    """
+    def __init__(self):
+        self.parts = []
+        self.buffer = []
+        self.skip = 0
+
+    def _flush(self):
+        if self.buffer:
+            if not self.skip:
+                self.parts.append(''.join(self.buffer))
+            self.buffer = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag in SKIP_TAGS:
+            self.skip += 1
+
+    def end(self, tag):
+        self._flush()
+        if tag in SKIP_TAGS and self.skip:
+            self.skip -= 1
+
+    def data(self, data):
+        self.buffer.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def pi(self, target, data=None):
+        self._flush()
+
+    def doctype(self, *args):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return '\n'.join(self.parts)
+
+def lxml_text(content):
+    from lxml import etree
+
+    text = decode(content)
+    parser = etree.HTMLParser(target=_TextTarget(), recover=True,
+                              remove_comments=False, no_network=True)
+    for i in range(0, len(text), CHUNK_SIZE):
+        parser.feed(text[i:i+CHUNK_SIZE])
+    return parser.close()
+
+def bs4_text(content):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup( content, "html.parser" )
+    return soup.get_text("\n")
+
+BACKENDS = {
+    'lxml': lxml_text,
+    'bs4': bs4_text,
+}
+
+def default_backend():
+    try:
+        import lxml.etree
+        return 'lxml'
+    except ImportError:
+        return 'bs4'
+
+def get_text(content, backend=None):
+    if backend is None:
+        backend = default_backend()
+    if backend not in BACKENDS:
+        raise ValueError("Unknown html backend {}, choose from {}".format(backend, sorted(BACKENDS)))
+    return BACKENDS[backend](content)
+
+
+if __name__ == '__main__':
+    # Equivalence and throughput check on html files:
+    # python htmltext.py file1.html file2.txt ...
+    from normalizer import process_text
+
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as fin:
+            content = fin.read()
+
+        results = {}
+        for backend in sorted(BACKENDS):
+            _start = time.time()
+            text = get_text(content, backend)
+            elapsed = time.time() - _start
+            results[backend] = process_text(text)
+            print("{} {}: {:.3f}s, {:.2f} MB/s".format(
+                path, backend, elapsed, len(content) / 1e6 / max(elapsed, 1e-9)))
+
+        same = results['lxml'] == results['bs4']
+        print("{} processed text identical: {}".format(path, same))
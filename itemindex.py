@@ -0,0 +1,89 @@
+from bisect import bisect_left
+import re
+
+# Every "\nITEM" header, with its item number when there is one (7, 7A, 1A ...)
+ITEM_HEADER = re.compile(r'\nITEM(?: ?(\d{1,2}[A-Z]?))?')
+ITEM_HEADER_BYTES = re.compile(ITEM_HEADER.pattern.encode('ascii'))
+
+# Define start & end signal for parsing
+ITEM7_BEGINS = [ '\nITEM 7.', '\nITEM 7 –','\nITEM 7:', '\nITEM 7 ', '\nITEM 7\n' ]
+ITEM7_ENDS   = [ '\nITEM 7A' ]
+ITEM7_NEXT   = '\nITEM 7' # Case: ITEM 7A does not exist
+ITEM8_BEGINS = [ '\nITEM 8'  ]
+
+# Header characters (or utf-8 bytes) kept to match the signals above
+TAIL = max(len(p.encode('utf-8')) for p in ITEM7_BEGINS + ITEM7_ENDS + ITEM8_BEGINS)
+
+class ItemIndex(object):
+    """
+        Offsets of every ITEM header of a processed text, found in one regex
+        scan. Sections are located from this table without copying the text.
+        text may also be utf-8 bytes or a mmap, offsets are then byte offsets.
+    """
+    def __init__(self, text):
+        self.length = len(text)
+        self.binary = not isinstance(text, str)
+        self.offsets = []
+        self.items = []
+        self.tails = []
+
+        pattern = ITEM_HEADER_BYTES if self.binary else ITEM_HEADER
+        for match in pattern.finditer(text):
+            begin = match.start()
+            item = match.group(1)
+            if self.binary and item is not None:
+                item = item.decode('ascii')
+            self.offsets.append(begin)
+            self.items.append(item)
+            self.tails.append(text[begin:begin+TAIL])
+
+    def find(self, prefix, start=0):
+        """
+            Offset of the first header at or after start beginning with prefix, -1 if none
+        """
+        if self.binary:
+            prefix = prefix.encode('utf-8')
+        for i in range(bisect_left(self.offsets, start), len(self.offsets)):
+            if self.tails[i].startswith(prefix):
+                return self.offsets[i]
+        return -1
+
+    def locate_mda(self, start=0):
+        """
+            Return (begin, end) of the MD&A after start, (-1, -1) if not found.
+            Begin signals are tried in priority order, the section ends at
+            ITEM 7A (or the next ITEM 7 when start != 0), else at ITEM 8.
+        """
+        for item7 in ITEM7_BEGINS:
+            begin = self.find(item7, start)
+            if begin != -1:
+                break
+        else:
+            return -1, -1
+
+        item7_ends = ITEM7_ENDS + ([ITEM7_NEXT] if start != 0 else [])
+        for prefix in item7_ends + ITEM8_BEGINS:
+            end = self.find(prefix, begin+1)
+            if end != -1:
+                return begin, end
+
+        return begin, -1
+
+    def sections(self):
+        """
+            List of (item, begin, end) for every numbered ITEM header,
+            a section ends where the next header begins
+        """
+        bounds = self.offsets[1:] + [self.length]
+        return [ (item, begin, end)
+                 for item, begin, end in zip(self.items, self.offsets, bounds)
+                 if item is not None ]
+
+    def section(self, item, start=0):
+        """
+            (begin, end) of the first section of item ('1A', '7', ...) at or after start
+        """
+        for section_item, begin, end in self.sections():
+            if section_item == item and begin >= start:
+                return begin, end
+        return -1, -1
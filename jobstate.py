@@ -0,0 +1,137 @@
+"""
+    SQLite store of the state of every filing, keyed by accession number
+
+    Each stage of a filing (download, text, mda, score) is recorded as it
+    completes with its status, error, bytes and seconds, so a rerun resumes
+    where the last one stopped and only retries the statuses it is asked to.
+
+    python jobstate.py [jobs.db]  prints the progress of every stage
+"""
+import sqlite3
+import sys
+import threading
+import time
+
+STAGES = ['download', 'text', 'mda', 'score']
+
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'
+
+def split_message(msg):
+    """
+        parsing.log message -> (status, error), 'FAILED: <error>' -> (FAILED, error)
+    """
+    if msg.startswith(FAILED):
+        return FAILED, msg[len(FAILED):].lstrip(': ')
+    return msg, None
+
+def accession_of(name):
+    """
+        <cik>_<accession>[.txt|.mda] -> accession
+    """
+    return name.split('.')[0].split('_', 1)[-1]
+
+class JobState(object):
+    """
+        Written by the parent process only, workers return their results.
+        Results may arrive from another thread than the one that opened
+        the store, so the connection is shared between threads under a lock.
+        WAL journaling lets progress be read while a run is writing.
+    """
+    def __init__(self, path='jobs.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS filings (accession TEXT PRIMARY KEY, name TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                          'accession TEXT, stage TEXT, status TEXT, error TEXT, bytes INTEGER, '
+                          'seconds REAL, attempts INTEGER, updated REAL, PRIMARY KEY (accession, stage))')
+        self.conn.commit()
+
+    def __getstate__(self):
+        # Workers pickled along with an owner of the store get no connection
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def register(self, names):
+        """
+            Add the <cik>_<accession> names of selected filings
+        """
+        with self.lock:
+            self.conn.executemany('INSERT OR IGNORE INTO filings VALUES (?, ?)',
+                                  [(accession_of(name), name) for name in names])
+            self.conn.commit()
+
+    def record(self, accession, stage, status, error=None, nbytes=None, seconds=None):
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, 1, ?) '
+                'ON CONFLICT (accession, stage) DO UPDATE SET status = excluded.status, '
+                'error = excluded.error, bytes = excluded.bytes, seconds = excluded.seconds, '
+                'attempts = attempts + 1, updated = excluded.updated',
+                (accession, stage, status, error, nbytes, seconds, time.time()))
+            self.conn.commit()
+
+    def record_message(self, accession, stage, msg, nbytes=None, seconds=None):
+        """
+            Record a parsing.log message, SUCCESS, MDA NOT FOUND or FAILED: <error>
+        """
+        status, error = split_message(msg)
+        self.record(accession, stage, status, error, nbytes, seconds)
+
+    def status(self, accession, stage):
+        with self.lock:
+            row = self.conn.execute('SELECT status FROM jobs WHERE accession = ? AND stage = ?',
+                                    (accession, stage)).fetchone()
+        return row[0] if row else None
+
+    def finished(self, stage, retry=()):
+        """
+            Accessions with a recorded status of stage that is not in retry
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT accession, status FROM jobs WHERE stage = ?', (stage,)).fetchall()
+        retry = set(retry)
+        return set(accession for accession, status in rows if status not in retry)
+
+    def progress(self):
+        """
+            [(stage, status, count, bytes, seconds)] and the number of filings
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT stage, status, COUNT(*), SUM(bytes), SUM(seconds) '
+                                     'FROM jobs GROUP BY stage, status').fetchall()
+            total = self.conn.execute('SELECT COUNT(*) FROM filings').fetchone()[0]
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        rows.sort(key=lambda row: (order.get(row[0], len(order)), row[1]))
+        return rows, total
+
+    def print_progress(self):
+        rows, total = self.progress()
+        print("{} filings".format(total))
+        for stage, status, count, nbytes, seconds in rows:
+            print("{:>8} {:<16} {:>8} {:>10.1f} MB {:>10.1f} s".format(
+                stage, status, count, (nbytes or 0) / 1e6, seconds or 0))
+
+    def merge(self, path):
+        """
+            Copy the filings and jobs of the store at path, e.g. of a shard
+        """
+        with self.lock:
+            self.conn.execute('ATTACH DATABASE ? AS other', (path,))
+            self.conn.execute('INSERT OR IGNORE INTO filings SELECT * FROM other.filings')
+            self.conn.execute('INSERT OR REPLACE INTO jobs SELECT * FROM other.jobs')
+            self.conn.commit()
+            self.conn.execute('DETACH DATABASE other')
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    JobState(sys.argv[1] if len(sys.argv) > 1 else 'jobs.db').print_progress()
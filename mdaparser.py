@@ -1,133 +1,157 @@
 import codecs
 import csv
+from itertools import chain
+import mmap
 import os
 import time
 
-from pathos.pools import ProcessPool
-from pathos.helpers import cpu_count
-import requests
+from executor import Executor
+from itemindex import ItemIndex
+from jobstate import accession_of
+from metrics import Metrics, timed
 
 class MDAParser(object):
-    def __init__(self, txt_dir, mda_dir):
+    def __init__(self, txt_dir, mda_dir, use_mmap=False, job_state=None, ncpus=None, executor=None,
+                 metrics=None):
+        # Search ITEM headers in the memory mapped utf-8 bytes and only
+        # decode the MD&A, instead of reading each text into a str
+        self.use_mmap = use_mmap
+
+        # Results are recorded to this jobstate.JobState when given
+        self.job_state = job_state
+        # Parsing runs on this executor.Executor, shared with the other stages when given
+        self.executor = executor or Executor(ncpus)
+        # Parsing timings are recorded to this metrics.Metrics
+        self.metrics = metrics or Metrics()
+
         self.txt_dir    = txt_dir
-        if not os.path.exists(txt_dir):
+        if txt_dir and not os.path.exists(txt_dir):
             os.makedirs(txt_dir)
 
         self.mda_dir    = mda_dir
-        if not os.path.exists(mda_dir):
+        if mda_dir and not os.path.exists(mda_dir):
             os.makedirs(mda_dir)
 
-    def extract(self):
+    def extract(self, retry=(), parsing_log='parsing.log', texts=(), writing=()):
+        """
+            Parse the MD&A of every text in txt_dir, writing each result to
+            parsing_log as it completes. With a job state, texts whose mda
+            stage is recorded are skipped unless their status is in retry,
+            and parsing_log is appended to, keeping the results of earlier runs.
+            texts yields names of texts written to txt_dir during the run
+            (Form10k.iter_download), they are parsed as they arrive, even
+            when their mda stage is recorded.
+            writing holds the accession numbers of the texts being written
+            (Form10k.writing), their files already in txt_dir are stale or
+            partial and are only parsed once they arrive from texts.
+        """
+        finished = set()
+        if self.job_state is not None:
+            finished = self.job_state.finished('mda', retry)
+
+        writing = set(writing)
 
         def text_gen(txt_dir):
             # Yields markup & name
-            for fname in os.listdir(txt_dir):
-                if not fname.endswith('.txt'):
+            seen = set()
+            listed = [fname for fname in os.listdir(txt_dir)
+                      if fname.endswith('.txt') and accession_of(fname) not in writing
+                      and accession_of(fname) not in finished]
+            # Texts written during the run replace the ones their mda stage
+            # was recorded for, so they are parsed again whatever its status
+            for fname in chain(listed, texts):
+                if fname in seen:
                     continue
+                seen.add(fname)
                 yield fname
 
         def parsing_job(fname):
-            print("Parsing: {}".format(fname))
-            # Read text
             filepath = os.path.join(self.txt_dir,fname)
-            with codecs.open(filepath,'rb',encoding='utf-8') as fin:
-                text = fin.read()
-
             name, ext = os.path.splitext(fname)
-            # Parse MDA part
-
-            msg = ""
-            mda, end = self.parse_mda(text)
-            # Parse second time if first parse results in index
-            if mda and len(mda.encode('utf-8')) < 1000:
-                mda, _ = self.parse_mda(text, start=end)
-
-            if mda: # Has value
-                msg = "SUCCESS"
-                mda_path = os.path.join(self.mda_dir, name + '.mda')
-                with codecs.open(mda_path,'w', encoding='utf-8') as fout:
-                    fout.write(mda)
-            else:
-                msg = msg if mda else "MDA NOT FOUND"
-            print("{},{}".format(name,msg))
-            return name + '.txt', msg #
+            timings = {}
+            _start = time.time()
 
+            # Parse MDA part
+            try:
+                if self.use_mmap:
+                    with open(filepath,'rb') as fin:
+                        if os.fstat(fin.fileno()).st_size == 0:
+                            mda = ""
+                        else:
+                            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as text, \
+                                 timed(timings, 'mda_locate_seconds'):
+                                mda = self.find_mda(text)
+                else:
+                    # Read text
+                    with codecs.open(filepath,'rb',encoding='utf-8') as fin:
+                        text = fin.read()
+                    with timed(timings, 'mda_locate_seconds'):
+                        mda = self.find_mda(text)
+
+                if mda: # Has value
+                    msg = "SUCCESS"
+                    mda_path = os.path.join(self.mda_dir, name + '.mda')
+                    with codecs.open(mda_path,'w', encoding='utf-8') as fout:
+                        fout.write(mda)
+                    nbytes = os.path.getsize(mda_path)
+                else:
+                    msg = "MDA NOT FOUND"
+                    nbytes = None
+            except BaseException as e:
+                msg = "FAILED: {}".format(e)
+                nbytes = None
+            return name + '.txt', msg, nbytes, time.time() - _start, timings
 
-        ncpus = cpu_count() if cpu_count() <= 8 else 8
-        pool = ProcessPool( ncpus )
 
         _start = time.time()
-        parsing_failed = pool.map( parsing_job, \
-                                   text_gen(self.txt_dir) )
-        _end = time.time()
-
-        print("MDA parsing time taken: {} seconds.".format(_end-_start))
-
-        # Write failed parsing list
         count = 0
-        parsing_log = 'parsing.log'
-        with open(parsing_log,'w') as fout:
+        # A resumed run only parses the remaining texts
+        with open(parsing_log,'a' if self.job_state is not None else 'w') as fout:
             print("Writing parsing results to {}".format(parsing_log))
-            for name, msg in parsing_failed:
-                fout.write('{},{}\n'.format(name,msg))
+            for fname, msg, nbytes, seconds, timings in self.executor.imap( parsing_job, text_gen(self.txt_dir) ):
+                fout.write('{},{}\n'.format(fname,msg))
+                fout.flush()
+                self.metrics.record_message('mda', fname, msg, mda_seconds=seconds, mda_bytes=nbytes, **timings)
+                if self.job_state is not None:
+                    self.job_state.record_message(accession_of(fname), 'mda', msg, nbytes, seconds)
                 if msg != "SUCCESS":
                     count = count + 1
+        _end = time.time()
 
+        print("MDA parsing time taken: {} seconds.".format(_end-_start))
         print("Number of failed text:{}".format(count))
 
-    def parse_mda(self, text, start=0):
-        debug = False
+    def find_mda(self, text):
         """
-            Return Values
+            Parse the MD&A of text (str, utf-8 bytes or mmap), skipping a
+            first match that is only the table of contents
         """
-
-        mda = ""
-        end = 0
-
+        index = ItemIndex(text)
+        mda, end = self.parse_mda(text, index=index)
+        # Parse second time if first parse results in index
+        if mda and len(mda.encode('utf-8')) < 1000:
+            mda, _ = self.parse_mda(text, start=end, index=index)
+        return mda
+
+    def parse_mda(self, text, start=0, index=None):
         """
-            Parsing Rules
+            Return the MD&A after start and its end offset relative to start.
+            Pass the ItemIndex of text to reuse it between calls.
+            For utf-8 bytes or mmap text, offsets are in bytes and only the
+            MD&A is decoded.
         """
+        if index is None:
+            index = ItemIndex(text)
 
-        # Define start & end signal for parsing
-        item7_begins = [ '\nITEM 7.', '\nITEM 7 –','\nITEM 7:', '\nITEM 7 ', '\nITEM 7\n' ]
-        item7_ends   = [ '\nITEM 7A' ]
-        if start != 0:
-            item7_ends.append('\nITEM 7') # Case: ITEM 7A does not exist
-        item8_begins = [ '\nITEM 8'  ]
+        mda = ""
+        end = 0
 
-        """
-            Parsing code section
-        """
-        text = text[start:]
-
-        # Get begin
-        for item7 in item7_begins:
-            begin = text.find(item7)
-            if debug:
-                print(item7,begin)
-            if begin != -1:
-                break
-
-        if begin != -1: # Begin found
-            for item7A in item7_ends:
-                end = text.find(item7A, begin+1)
-                if debug:
-                    print(item7A,end)
-                if end != -1:
-                    break
-
-            if end == -1: # ITEM 7A does not exist
-                for item8 in item8_begins:
-                    end = text.find(item8, begin+1)
-                    if debug:
-                        print(item8,end)
-                    if end != -1:
-                        break
-
-            # Get MDA
-            if end > begin:
-                mda = text[begin:end].strip()
-            else:
-                end = 0
+        begin, item_end = index.locate_mda(start)
+        if begin != -1 and item_end > begin:
+            section = text[begin:item_end]
+            if index.binary:
+                section = section.decode('utf-8')
+            mda = section.strip()
+            end = item_end - start
 
         return mda, end
@@ -0,0 +1,182 @@
+"""
+    Counters and histograms of a run, exported as a Prometheus textfile
+
+    Workers return their timings along with their results and the parent
+    process records them here, nothing is shared between processes.
+    Histograms take their buckets from the unit suffix of the metric name
+    (_seconds, _bytes, _lines). With an events file every filing result is
+    also written as one JSON line.
+
+    run.py --metrics_file metrics.prom  (node_exporter textfile collector)
+           --events_file events.jsonl
+"""
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+from jobstate import split_message
+
+PREFIX = 'edgar'
+
+BUCKETS = {'seconds': (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+           'bytes': (1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+           'lines': (1, 10, 100, 1e3, 1e4, 1e5)}
+
+@contextmanager
+def timed(values, key):
+    """
+        Add the seconds spent in the block to values[key]
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        values[key] = values.get(key, 0) + time.time() - start
+
+def _labels(labels, **extra):
+    items = sorted(labels) + sorted(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for k, v in items) + '}'
+
+def _number(x):
+    return repr(float(x)) if isinstance(x, float) and not x.is_integer() else str(int(x))
+
+class Metrics(object):
+    """
+        textfile is rewritten at most every interval seconds while results
+        are recorded and on close, events is appended to.
+    """
+    def __init__(self, textfile=None, events=None, interval=10, prefix=PREFIX):
+        self.textfile = textfile
+        self.events_path = events
+        self.interval = interval
+        self.prefix = prefix
+
+        self.lock = threading.Lock()
+        self.counters = {}   # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> [bucket counts, sum, count]
+        self.events = open(events,'a') if events else None
+        self.flushed = time.time()
+
+    def __getstate__(self):
+        # Workers pickled along with an owner of the metrics do not record
+        return {'prefix': self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(prefix=state['prefix'])
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def value(self, name, **labels):
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def observe(self, name, value, **labels):
+        buckets = BUCKETS[name.rsplit('_', 1)[-1]]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(buckets), 0, 0]
+            histogram = self.histograms[key]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def record(self, stage, name, status, error=None, **values):
+        """
+            Result of one filing at a stage: counts filings_total{stage, status},
+            observes each of values (metric name -> seconds, bytes) and writes
+            an event
+        """
+        self.inc('filings_total', stage=stage, status=status)
+        for key, value in values.items():
+            if value is not None:
+                self.observe(key, value)
+        self.event(stage=stage, name=name, status=status, error=error, **values)
+        if self.textfile and time.time() - self.flushed >= self.interval:
+            self.flush()
+
+    def record_message(self, stage, name, msg, **values):
+        status, error = split_message(msg)
+        self.record(stage, name, status, error, **values)
+
+    def event(self, **fields):
+        if self.events is None:
+            return
+        line = json.dumps(dict(time=time.time(), **fields))
+        with self.lock:
+            self.events.write(line + '\n')
+
+    def prometheus(self):
+        """
+            Prometheus text exposition of every counter and histogram
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, ([c for c in h[0]], h[1], h[2])) for key, h in self.histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            name = '{}_{}'.format(self.prefix, name)
+            if name not in typed:
+                lines.append('# TYPE {} counter'.format(name))
+                typed.add(name)
+            lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+
+        for (name, labels), (counts, total, count) in histograms:
+            buckets = BUCKETS[name.rsplit('_', 1)[-1]]
+            name = '{}_{}'.format(self.prefix, name)
+            if name not in typed:
+                lines.append('# TYPE {} histogram'.format(name))
+                typed.add(name)
+            for bound, n in zip(buckets, counts):
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels, le=_number(bound)), n))
+            lines.append('{}_bucket{} {}'.format(name, _labels(labels, le='+Inf'), count))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(total)))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """
+            Rewrite the textfile (atomically, for the textfile collector)
+            and flush the events file
+        """
+        self.flushed = time.time()
+        if self.textfile:
+            tmp_path = '{}.{}.tmp'.format(self.textfile, os.getpid())
+            with open(tmp_path,'w') as fout:
+                fout.write(self.prometheus())
+            os.replace(tmp_path, self.textfile)
+        if self.events is not None:
+            with self.lock:
+                self.events.flush()
+
+    def print_summary(self):
+        """
+            Every counter, e.g. the filings of each stage and status, then the
+            count, total and mean of every histogram, where the time went
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, h[1], h[2]) for key, h in self.histograms.items())
+        for (name, labels), value in counters:
+            print("{:<28} {:>8}".format(name + _labels(labels), _number(value)))
+        for (name, labels), total, count in histograms:
+            print("{:<28} {:>8} obs {:>14.3f} total {:>12.4f} mean".format(
+                name + _labels(labels), count, total, total / count if count else 0))
+
+    def close(self):
+        self.flush()
+        if self.events is not None:
+            self.events.close()
+            self.events = None
@@ -0,0 +1,147 @@
+"""
+    Text normalization shared by Form10k._process_text and preprocess_text.process_text
+
+    process_text gives byte for byte the output of the original chain of
+    splitlines / upper / three re.sub / ten str.replace passes with fewer copies:
+      - NFKD is skipped for pure ASCII text, where it is the identity, and
+        NFKD / upper of non ASCII text run on line aligned chunks, since
+        str.upper allocates a 3x UCS4 buffer of its input
+      - line break normalization and the three whitespace regexes are fused
+        into one compiled substitution, without building a list of lines
+      - the header and symbol repairs stay as str.replace, which only copies
+        the text when the pattern occurs
+"""
+import re
+import sys
+import time
+import tracemalloc
+import unicodedata
+
+# Characters str.splitlines() breaks on
+LINE_BREAKS = '\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+# A run of spaces and line breaks containing at least one line break, other
+# than a lone '\n' which is already collapsed. The lookbehind keeps long runs
+# of spaces from being rescanned.
+_WHITESPACE_RUN = re.compile('(?<![ ])(?:[ ]+[{0}]|[{0}](?=[ {0}])|[{1}])[ {0}]*'.format(
+    LINE_BREAKS, LINE_BREAKS.replace('\n', '')))
+
+# Characters per chunk for NFKD and upper of non ASCII text
+CHUNK_SIZE = 1 << 20
+
+# Applied in order after whitespace collapsing
+REPLACEMENTS = (
+    # To find MDA section, reformat item headers
+    ('\n.\n', '.\n'), # Move Period to beginning
+    ('\nI\nTEM', '\nITEM'),
+    ('\nITEM\n', '\nITEM '),
+    ('\nITEM  ', '\nITEM '),
+    (':\n', '.\n'),
+    # Math symbols for clearer looks
+    ('$\n', '$'),
+    ('\n%', '%'),
+    # Reformat by additional breakline
+    ('\n', '\n\n'),
+)
+
+def _map_chunks(func, text):
+    """
+        Apply func to chunks split before a '\n', which is never part of a
+        combining sequence, so NFKD and upper give the same result as on the
+        whole text
+    """
+    if len(text) <= CHUNK_SIZE:
+        return func(text)
+
+    chunks = []
+    begin = 0
+    while begin < len(text):
+        end = text.find('\n', begin + CHUNK_SIZE)
+        end = len(text) if end == -1 else end
+        chunks.append(func(text[begin:end]))
+        begin = end
+    return ''.join(chunks)
+
+def process_text(text):
+    """
+        Preprocess Text
+    """
+    is_ascii = text.isascii()
+    if not is_ascii:
+        text = _map_chunks(lambda chunk: unicodedata.normalize("NFKD", chunk), text)
+
+    # splitlines drops the final line break
+    if text.endswith('\r\n'):
+        text = text[:-2]
+    elif text and text[-1] in LINE_BREAKS:
+        text = text[:-1]
+
+    text = text.upper() if is_ascii else _map_chunks(str.upper, text)
+
+    # Unicode breaklines & whitespaces combinations due to html parsing
+    text = _WHITESPACE_RUN.sub('\n', text)
+
+    for old, new in REPLACEMENTS:
+        text = text.replace(old, new)
+
+    return text
+
+def process_text_reference(text):
+    """
+        Original multi pass implementation, kept to check process_text against
+    """
+    text = unicodedata.normalize("NFKD", text) # Normalize
+    text = '\n'.join(text.splitlines()) # Let python take care of unicode break lines
+
+    # Convert to upper
+    text = text.upper() # Convert to upper
+
+    # Take care of breaklines & whitespaces combinations due to beautifulsoup parsing
+    text = re.sub(r'[ ]+\n', '\n', text)
+    text = re.sub(r'\n[ ]+', '\n', text)
+    text = re.sub(r'\n+', '\n', text)
+
+    # To find MDA section, reformat item headers
+    text = text.replace('\n.\n','.\n') # Move Period to beginning
+
+    text = text.replace('\nI\nTEM','\nITEM')
+    text = text.replace('\nITEM\n','\nITEM ')
+    text = text.replace('\nITEM  ','\nITEM ')
+
+    text = text.replace(':\n','.\n')
+
+    # Math symbols for clearer looks
+    text = text.replace('$\n','$')
+    text = text.replace('\n%','%')
+
+    # Reformat
+    text = text.replace('\n','\n\n') # Reformat by additional breakline
+
+    return text
+
+def measure(func, text):
+    """
+        Returns (output, seconds, peak traced memory in bytes)
+    """
+    tracemalloc.start()
+    _start = time.time()
+    output = func(text)
+    elapsed = time.time() - _start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, elapsed, peak
+
+
+if __name__ == '__main__':
+    # Equivalence check and benchmark on text files:
+    # python normalizer.py file1.txt file2.txt ...
+    for path in sys.argv[1:]:
+        with open(path,'r',encoding='utf-8',errors='ignore') as fin:
+            text = fin.read()
+
+        expected, ref_time, ref_peak = measure(process_text_reference, text)
+        output, new_time, new_peak = measure(process_text, text)
+
+        print("{}: identical {}, {:.3f}s -> {:.3f}s ({:.1f}x), peak {:.1f}MB -> {:.1f}MB".format(
+            path, output == expected, ref_time, new_time, ref_time / max(new_time, 1e-9),
+            ref_peak / 1e6, new_peak / 1e6))
@@ -0,0 +1,263 @@
+"""
+    NumPy inference of the encoder.Model mLSTM, without a TensorFlow graph
+
+    Same transform / cell_transform interface and outputs as encoder.Model:
+      - the weight norm is applied once when the model/*.npy params are loaded
+      - inputs are bytes, so the embedding is folded into 256 row tables of
+        the x projections and a timestep only multiplies the h projections
+      - rows still left padded at a timestep are skipped instead of blended
+      - precision='int8' or 'bfloat16' keeps the recurrent weights wh / wmh
+        in 1 or 2 bytes, dequantized to float32 a block of rows at a time
+"""
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+def load_params(model_dir='model'):
+    """
+        [embd w, wx, wh, wmx, wmh, b, gx, gh, gmx, gmh, out w, out b],
+        wh is saved as 4 gate blocks
+    """
+    params = [np.load(os.path.join(model_dir, '%d.npy' % i)) for i in range(15)]
+    params[2] = np.concatenate(params[2:6], axis=1)
+    params[3:6] = []
+    return params
+
+def model_key(model_dir='model'):
+    """
+        Identity of the params files, size and mtime of each
+    """
+    stats = [os.stat(os.path.join(model_dir, '%d.npy' % i)) for i in range(15)]
+    return ['%d:%d' % (stat.st_size, stat.st_mtime_ns) for stat in stats]
+
+def weight_norm(w, g):
+    """
+        tf.nn.l2_normalize(w, dim=0) * g
+    """
+    w = w.astype(np.float64)
+    norm = np.sqrt(np.maximum(np.sum(w * w, axis=0), 1e-12))
+    return w / norm * g
+
+def ceil_round_step(n, step):
+    return int(np.ceil(n/step)*step)
+
+def batch_pad(xs, nbatch, nsteps):
+    xmb = np.zeros((nbatch, nsteps), dtype=np.int32)
+    mmb = np.ones((nbatch, nsteps, 1), dtype=np.float32)
+    for i, x in enumerate(xs):
+        l = len(x)
+        npad = nsteps-l
+        xmb[i, -l:] = list(x)
+        mmb[i, :npad] = 0
+    return xmb, mmb
+
+PRECISIONS = ['float32', 'bfloat16', 'int8']
+
+# float32 bytes of a dequantized block of weight rows
+BLOCK_BYTES = 8 << 20
+
+def to_bfloat16(w):
+    """
+        bfloat16 bits (uint16) of float32 w, rounded to nearest even
+    """
+    bits = np.ascontiguousarray(w, dtype=np.float32).view(np.uint32)
+    bits = bits + (((bits >> 16) & 1) + 0x7fff)
+    return (bits >> 16).astype(np.uint16)
+
+class ReducedMatrix(object):
+    """
+        float32 matrix stored as int8 with a scale per column or as bfloat16.
+        x @ matrix dequantizes BLOCK_BYTES of rows at a time into one buffer
+        and accumulates their float32 products.
+    """
+    # Let numpy defer x @ matrix to __rmatmul__
+    __array_ufunc__ = None
+
+    def __init__(self, w, precision):
+        self.precision = precision
+        self.shape = w.shape
+        if precision == 'int8':
+            scale = np.abs(w).max(axis=0) / 127
+            self.scale = np.where(scale > 0, scale, 1).astype(np.float32)
+            self.data = np.round(w / self.scale).astype(np.int8)
+        elif precision == 'bfloat16':
+            self.scale = None
+            self.data = to_bfloat16(w)
+        else:
+            raise ValueError("Unknown precision {}, choose from {}".format(precision, PRECISIONS))
+
+        self.block = max(1, BLOCK_BYTES // (4 * self.shape[1]))
+        self.buffer = np.empty((min(self.block, self.shape[0]), self.shape[1]), dtype=np.float32)
+
+    def dequantize(self, begin, end, out):
+        if self.precision == 'int8':
+            out[...] = self.data[begin:end]
+        else:
+            bits = out.view(np.uint32)
+            bits[...] = self.data[begin:end]
+            bits <<= 16
+        return out
+
+    def __rmatmul__(self, x):
+        z = np.zeros((len(x), self.shape[1]), dtype=np.float32)
+        for begin in range(0, self.shape[0], self.block):
+            end = min(begin + self.block, self.shape[0])
+            w = self.dequantize(begin, end, self.buffer[:end-begin])
+            z += x[:, begin:end] @ w
+        if self.scale is not None:
+            z *= self.scale
+        return z
+
+    def toarray(self):
+        return self.dequantize(0, self.shape[0], np.empty(self.shape, dtype=np.float32)) * \
+            (1 if self.scale is None else self.scale)
+
+def _sigmoid(x):
+    """
+        In place, tanh form does not overflow
+    """
+    x *= 0.5
+    np.tanh(x, out=x)
+    x += 1
+    x *= 0.5
+    return x
+
+class Model(object):
+
+    def __init__(self, nbatch=128, nsteps=64, model_dir='model', cache=None, precision='float32'):
+        self.nbatch = nbatch
+        self.nsteps = nsteps
+        # featurecache.FeatureCache consulted by transform
+        self.cache = cache
+
+        embd, wx, wh, wmx, wmh, b, gx, gh, gmx, gmh, out_w, out_b = load_params(model_dir)
+        self.nhidden = wmh.shape[0]
+
+        # x is a byte, x @ w is a row of embd @ w
+        self.xw = (embd.astype(np.float64) @ weight_norm(wx, gx)).astype(np.float32)
+        self.xmw = (embd.astype(np.float64) @ weight_norm(wmx, gmx)).astype(np.float32)
+        self.xw += b
+        self.wh = weight_norm(wh, gh).astype(np.float32)
+        self.wmh = weight_norm(wmh, gmh).astype(np.float32)
+
+        # h @ wh and h @ wmh read these weights at every timestep
+        self.precision = precision
+        if precision != 'float32':
+            self.wh = ReducedMatrix(self.wh, precision)
+            self.wmh = ReducedMatrix(self.wmh, precision)
+
+    def _run(self, xmb, mmb, smb, cells=None):
+        """
+            Run the mLSTM over xmb from states smb = [c, h], returns the final
+            states and fills cells[t] with c at each timestep when given
+        """
+        nhidden = self.nhidden
+        c = np.array(smb[0], dtype=np.float32)
+        h = np.array(smb[1], dtype=np.float32)
+        active = mmb[:, :, 0] > 0
+
+        for t in range(xmb.shape[1]):
+            rows = np.flatnonzero(active[:, t])
+            if len(rows) == len(xmb):
+                rows = slice(None)
+            elif len(rows) == 0:
+                if cells is not None:
+                    cells[t] = c
+                continue
+
+            x = xmb[rows, t]
+            m = self.xmw[x]
+            m *= h[rows] @ self.wmh
+            z = m @ self.wh
+            z += self.xw[x]
+
+            gates = _sigmoid(z[:, :3*nhidden])
+            u = np.tanh(z[:, 3*nhidden:], out=z[:, 3*nhidden:])
+            i = gates[:, :nhidden]
+            f = gates[:, nhidden:2*nhidden]
+            o = gates[:, 2*nhidden:]
+
+            ct = f * c[rows]
+            ct += i * u
+            c[rows] = ct
+            h[rows] = o * np.tanh(ct)
+            if cells is not None:
+                cells[t] = c
+
+        return np.stack([c, h])
+
+    def seq_rep(self, xmb, mmb, smb):
+        return self._run(xmb, mmb, smb)
+
+    def seq_cells(self, xmb, mmb, smb):
+        cells = np.empty((xmb.shape[1], len(xmb), self.nhidden), dtype=np.float32)
+        self._run(xmb, mmb, smb, cells)
+        return cells
+
+    def transform(self, xs, indexes=None):
+        # utils comes with the model files, the model runs on bytes without it
+        from utils import preprocess
+        xs = [preprocess(x) for x in xs]
+        if self.cache is not None and self.cache.covers(indexes):
+            return self.cache.features(xs, self._transform, indexes)
+
+        features = self._transform(xs)
+        if indexes is not None:
+            features = features[:, indexes]
+        return features
+
+    def _transform(self, xs):
+        nbatch, nsteps = self.nbatch, self.nsteps
+        lens = np.asarray([len(x) for x in xs])
+        sorted_idxs = np.argsort(lens)
+        unsort_idxs = np.argsort(sorted_idxs)
+        sorted_xs = [xs[i] for i in sorted_idxs]
+        maxlen = np.max(lens)
+        offset = 0
+        n = len(xs)
+        smb = np.zeros((2, n, self.nhidden), dtype=np.float32)
+        for step in range(0, ceil_round_step(maxlen, nsteps), nsteps):
+            start = step
+            end = step+nsteps
+            xsubseq = [x[start:end] for x in sorted_xs]
+            ndone = sum([x == b'' for x in xsubseq])
+            offset += ndone
+            xsubseq = xsubseq[ndone:]
+            sorted_xs = sorted_xs[ndone:]
+            nsubseq = len(xsubseq)
+            xmb, mmb = batch_pad(xsubseq, nsubseq, nsteps)
+            for batch in range(0, nsubseq, nbatch):
+                start = batch
+                end = batch+nbatch
+                batch_smb = self.seq_rep(
+                    xmb[start:end], mmb[start:end],
+                    smb[:, offset+start:offset+end, :])
+                smb[:, offset+start:offset+end, :] = batch_smb
+        features = smb[0, unsort_idxs, :]
+        return features
+
+    def cell_transform(self, xs, indexes=None):
+        from utils import preprocess, iter_data
+        Fs = []
+        xs = [preprocess(x) for x in xs]
+        for xmb in tqdm(
+                iter_data(xs, size=self.nbatch), ncols=80, leave=False,
+                total=len(xs)//self.nbatch):
+            smb = np.zeros((2, self.nbatch, self.nhidden), dtype=np.float32)
+            n = len(xmb)
+            xmb, mmb = batch_pad(xmb, self.nbatch, self.nsteps)
+            smb = self.seq_cells(xmb, mmb, smb)
+            smb = smb[:, :n, :]
+            if indexes is not None:
+                smb = smb[:, :, indexes]
+            Fs.append(smb)
+        Fs = np.concatenate(Fs, axis=1).transpose(1, 0, 2)
+        return Fs
+
+
+if __name__ == '__main__':
+    mdl = Model()
+    text = ['demo!']
+    text_features = mdl.transform(text)
+    print(text_features.shape)
@@ -0,0 +1,120 @@
+import codecs
+import csv
+import os
+import time
+
+from executor import Executor
+from Generic_Parser import OUTPUT_FIELDS, Scorer
+from jobstate import accession_of
+from mdaparser import MDAParser
+from metrics import timed
+
+def score_mda(mda, name):
+    """
+        Generic_Parser row of an MD&A, scored with the default dictionary
+    """
+    return Scorer().score_document(mda, name + '.mda')
+
+class FusedPipeline(object):
+    """
+        One worker pass per filing: raw submission -> processed 10-K text
+        -> MD&A -> Loughran-McDonald score row, with the text kept in memory.
+        txt_dir / mda_dir are optional sinks for the intermediate texts.
+    """
+    def __init__(self, form10k, txt_dir=None, mda_dir=None, ncpus=None, executor=None):
+        self.form10k = form10k
+        self.mda_parser = MDAParser(txt_dir=None, mda_dir=None)
+        # Filings run on this executor.Executor, shared with the other stages when given
+        self.executor = executor or Executor(ncpus)
+
+        self.txt_dir = txt_dir
+        self.mda_dir = mda_dir
+        for sink_dir in [txt_dir, mda_dir]:
+            if sink_dir and not os.path.exists(sink_dir):
+                os.makedirs(sink_dir)
+
+    def run(self, records, score_path, downloader=None, parsing_log='parsing.log', retry=()):
+        """
+            Score the filings of index records into score_path. Filings already
+            in an existing score_path are skipped and new rows are appended.
+            With a job state on form10k, filings whose score stage is recorded
+            are also skipped unless their status is in retry.
+        """
+        # Loading the dictionary before the pool forks shares it with workers
+        Scorer(print_flag=True).load()
+
+        done = set()
+        if os.path.exists(score_path):
+            with open(score_path,'r') as fin:
+                reader = csv.reader(fin)
+                next(reader, None)
+                done = set(row[0] for row in reader if row)
+
+        job_state = self.form10k.job_state
+        finished = set()
+        if job_state is not None:
+            finished = job_state.finished('score', retry)
+
+        urls = []
+        names = []
+        for rec in records:
+            url = os.path.join(self.form10k.archive_url,rec.filename)
+            name = self.form10k._name(url)
+            names.append(name)
+            if name not in done and accession_of(name) not in finished:
+                urls.append(url)
+        if job_state is not None:
+            job_state.register(names)
+        if len(names) > len(urls):
+            print("Skipping {} filings already scored".format(len(names) - len(urls)))
+            self.form10k.metrics.inc('skipped_total', len(names) - len(urls), stage='score')
+
+        form10k = self.form10k
+        def filing_job(args):
+            url, content = args
+            name = form10k._name(url)
+            timings = {}
+            _start = time.time()
+            try:
+                content = form10k._load(url, content)
+
+                text = form10k._parse_submission(content, timings)
+                if self.txt_dir:
+                    with codecs.open(os.path.join(self.txt_dir, name + '.txt'),'w',encoding='utf-8') as fout:
+                        fout.write(text)
+
+                with timed(timings, 'mda_locate_seconds'):
+                    mda = self.mda_parser.find_mda(text)
+                if not mda:
+                    return name, "MDA NOT FOUND", None, time.time() - _start, timings
+                timings['mda_bytes'] = len(mda.encode('utf-8'))
+                if self.mda_dir:
+                    with codecs.open(os.path.join(self.mda_dir, name + '.mda'),'w',encoding='utf-8') as fout:
+                        fout.write(mda)
+
+                with timed(timings, 'score_seconds'):
+                    row = score_mda(mda, name)
+                return name, "SUCCESS", row, time.time() - _start, timings
+            except BaseException as e:
+                return name, "FAILED: {}".format(e), None, time.time() - _start, timings
+
+        jobs = form10k._fetch_jobs(urls, downloader)
+
+        _start = time.time()
+        count = 0
+        new_file = not os.path.exists(score_path)
+        with open(score_path,'a') as f_out, open(parsing_log,'a') as f_log:
+            wr = csv.writer(f_out, lineterminator='\n')
+            if new_file:
+                wr.writerow(OUTPUT_FIELDS)
+            for name, msg, row, seconds, timings in self.executor.imap( filing_job, jobs ):
+                f_log.write('{},{}\n'.format(name + '.txt',msg))
+                f_log.flush()
+                form10k.metrics.record_message('score', name, msg, filing_seconds=seconds, **timings)
+                if job_state is not None:
+                    job_state.record_message(accession_of(name), 'score', msg, None, seconds)
+                if row is not None:
+                    wr.writerow(row)
+                    count += 1
+
+        print("Fused pipeline scored {} filings in {} seconds.".format(count, time.time()-_start))
@@ -0,0 +1,91 @@
+"""
+    Accuracy and speed of reduced precision npencoder weights on neuron 2388
+
+    python precision_report.py --mda_dir ./mda --precision int8 bfloat16
+
+    The files are the mda column of the results csv files, found in
+    --mda_dir by file name. Every line is run at float32 and at each
+    precision, errors are reported per line and per file mean, with the
+    float32 file means also compared to the stored 2388 values.
+"""
+import argparse
+import csv
+from glob import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from extract_review_sentiment import NEURON, iter_file_lines, neuron_values
+from npencoder import Model, PRECISIONS
+
+def read_results(patterns):
+    """
+        file name -> stored neuron value of the results csv files
+    """
+    stored = {}
+    for path in sorted(glob(patterns)):
+        with open(path,'r') as fin:
+            reader = csv.reader(fin)
+            header = next(reader)
+            column = header.index(str(NEURON))
+            for row in reader:
+                stored[os.path.basename(row[0])] = float(row[column])
+    return stored
+
+def run(model, mda_files, pool_lines):
+    """
+        ({mda_file: line values}, lines per second)
+    """
+    start = time.time()
+    values = dict(neuron_values(model, iter_file_lines(mda_files), pool_lines))
+    nlines = sum(len(v) for v in values.values())
+    return values, nlines / max(time.time() - start, 1e-9)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--mda_dir', type=str, default='./mda', help='mda file directory')
+    parser.add_argument('-r', '--results', type=str, default='results/gen_review_feature*.csv',
+                        help='glob of result csv files with the mda file names')
+    parser.add_argument('-p', '--precision', type=str, nargs='+', default=['bfloat16', 'int8'],
+                        choices=PRECISIONS[1:])
+    parser.add_argument('-n', '--max_files', type=int, default=100, help='files compared')
+    parser.add_argument('-b', '--batch_size', type=int, default=128, help='batch size of model')
+    parser.add_argument('--pool_lines', type=int, default=8192)
+    parser.add_argument('-o', '--out_file', type=str, help='json report file')
+    args = parser.parse_args()
+
+    stored = read_results(args.results)
+    mda_files = [os.path.join(args.mda_dir, name) for name in sorted(stored)]
+    mda_files = [path for path in mda_files if os.path.exists(path)][:args.max_files]
+    if not mda_files:
+        parser.error('none of the {} result files found in {}'.format(len(stored), args.mda_dir))
+    print('Comparing {} files'.format(len(mda_files)))
+
+    reference, reference_speed = run(Model(nbatch=args.batch_size), mda_files, args.pool_lines)
+    files = [f for f in mda_files if reference[f]]
+    reference_means = np.array([np.mean(reference[f]) for f in files])
+    stored_error = np.abs(reference_means - np.array([stored[os.path.basename(f)] for f in files]))
+
+    report = {'files': len(files),
+              'lines': sum(len(reference[f]) for f in files),
+              'float32': {'lines_per_sec': reference_speed,
+                          'stored_mean_abs_error': float(stored_error.mean())}}
+
+    for precision in args.precision:
+        values, speed = run(Model(nbatch=args.batch_size, precision=precision), mda_files, args.pool_lines)
+        line_error = np.abs(np.concatenate([np.subtract(values[f], reference[f]) for f in files]))
+        mean_error = np.abs(np.array([np.mean(values[f]) for f in files]) - reference_means)
+        report[precision] = {'lines_per_sec': speed,
+                             'speedup': speed / reference_speed,
+                             'line_max_abs_error': float(line_error.max()),
+                             'line_mean_abs_error': float(line_error.mean()),
+                             'line_p99_abs_error': float(np.percentile(line_error, 99)),
+                             'file_mean_max_abs_error': float(mean_error.max()),
+                             'file_mean_mean_abs_error': float(mean_error.mean())}
+
+    print(json.dumps(report, indent=2))
+    if args.out_file:
+        with open(args.out_file,'w') as fout:
+            json.dump(report, fout, indent=2)
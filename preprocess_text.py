@@ -1,55 +1,30 @@
+import argparse
 import codecs
 from glob import glob
 import os
-import re
+import time
 
-from pathos.pools import ProcessPool
-from pathos.helpers import cpu_count
 from tqdm import tqdm
-import unicodedata
+
+from executor import Executor, available_cpus
+from jobstate import SUCCESS
+from metrics import Metrics
+from normalizer import process_text
 
 src_dir = './txt'
 tar_dir = './ptxt'
 
-def process_text(text):
-    # Normalize due to unicode
-    text = unicodedata.normalize("NFKD", text) # Normalize
-    text = '\n'.join(text.splitlines()) # Let python take care of unicode break lines
-
-    # Convert to upper
-    text = text.upper() # Convert to upper
-
-    # Take care of breaklines & whitespaces combinations due to beautifulsoup parsing
-    text = re.sub(r'[ ]+\n', '\n', text)
-    text = re.sub(r'\n[ ]+', '\n', text)
-    text = re.sub(r'\n+', '\n', text)
-
-    # To find MDA section, reformat item headers
-    text = text.replace('\n.\n','.\n') # Move Period to beginning
-
-    text = text.replace('\nI\nTEM','\nITEM')
-    text = text.replace('\nITEM\n','\nITEM ')
-    text = text.replace('\nITEM  ','\nITEM ')
-
-    text = text.replace(':\n','.\n')
-
-    # Math symbols for clearer looks
-    text = text.replace('$\n','$')
-    text = text.replace('\n%','%')
-
-    # Reformat
-    text = text.replace('\n','\n\n') # Reformat by additional breakline
-
-    return text
-
 def preprocess_job(txt_path):
+    """
+        Returns the text name and the seconds taken, None when the text was
+        already preprocessed
+    """
     txt_name = os.path.basename(txt_path)
     new_path = os.path.join(tar_dir,txt_name)
     if os.path.exists(new_path):
-        print("{} already exists, skipping".format(new_path))
-        return
+        return txt_name, None
 
-    print("Preprocessing {}".format(txt_path))
+    _start = time.time()
     with codecs.open(txt_path,'r',encoding='utf-8') as fin:
         text = fin.read()
 
@@ -59,16 +34,28 @@ def preprocess_job(txt_path):
     # Write new files
     with codecs.open(new_path,'w',encoding='utf-8') as fout:
         fout.write(text)
-
-def mlp():
+    return txt_name, time.time() - _start
+
+def mlp(ncpus=None, metrics=None):
+    """
+        Preprocess the texts of src_dir into tar_dir on ncpus processes,
+        each text is recorded to metrics (metrics.Metrics) as it completes
+    """
+    metrics = metrics or Metrics()
     if not os.path.exists(tar_dir):
         os.makedirs(tar_dir)
 
-    iterator = glob(os.path.join(src_dir,'*.txt'))
+    txt_paths = glob(os.path.join(src_dir,'*.txt'))
 
-    ncpus = cpu_count() if cpu_count() <= 8 else 8;
-    pool = ProcessPool( ncpus )
-    pool.map( preprocess_job, iterator )
+    results = Executor(ncpus).imap( preprocess_job, txt_paths )
+    for txt_name, seconds in tqdm(results, total=len(txt_paths)):
+        if seconds is None:
+            metrics.inc('skipped_total', stage='preprocess')
+        else:
+            metrics.record('preprocess', txt_name, SUCCESS, preprocess_seconds=seconds)
+    print("Preprocessed {} texts, skipped {} already in {}".format(
+        metrics.value('filings_total', stage='preprocess', status=SUCCESS),
+        metrics.value('skipped_total', stage='preprocess'), tar_dir))
 
 
 def main():
@@ -91,5 +78,15 @@ def main():
             fout.write(text)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ncpus',type=int,default=available_cpus(),help='worker processes')
+    parser.add_argument('--metrics_file',type=str,default=None,help='Prometheus textfile of counters and histograms')
+    parser.add_argument('--events_file',type=str,default=None,help='JSON lines of every preprocessed text')
+    args = parser.parse_args()
+
     #main()
-    mlp()
+    metrics = Metrics(textfile=args.metrics_file, events=args.events_file)
+    try:
+        mlp(args.ncpus, metrics)
+    finally:
+        metrics.close()
@@ -0,0 +1,73 @@
+import gzip
+import os
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def accession_number(url):
+    """
+        edgar/data/1141807/0001214659-14-002350.txt -> 0001214659-14-002350
+    """
+    return os.path.splitext(os.path.basename(url))[0]
+
+class RawCache(object):
+    """
+        Compressed cache of raw EDGAR submissions keyed by accession number.
+        A submission filed under several CIKs is stored once.
+        Files are zstd compressed when zstandard is installed, gzip otherwise,
+        and both are readable.
+    """
+    def __init__(self, cache_dir, level=3):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.level = level
+        self.ext = '.zst' if zstandard is not None else '.gz'
+
+    def _path(self, accession, ext):
+        # Shard by filer id, the first part of the accession number
+        return os.path.join(self.cache_dir, accession.split('-')[0], accession + '.txt' + ext)
+
+    def _find(self, accession):
+        for ext in ['.zst','.gz']:
+            path = self._path(accession, ext)
+            if os.path.exists(path):
+                return path, ext
+        return None, None
+
+    def __contains__(self, accession):
+        return self._find(accession)[0] is not None
+
+    def get(self, accession):
+        path, ext = self._find(accession)
+        if path is None:
+            return None
+
+        with open(path,'rb') as fin:
+            data = fin.read()
+        if ext == '.zst':
+            if zstandard is None:
+                raise ImportError("zstandard is required to read {}".format(path))
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, accession, content):
+        if self.ext == '.zst':
+            data = zstandard.ZstdCompressor(level=self.level).compress(content)
+        else:
+            data = gzip.compress(content, compresslevel=min(self.level * 2, 9))
+
+        path = self._path(accession, self.ext)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+
+        # Write then rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd,'wb') as fout:
+            fout.write(data)
+        os.replace(tmp_path, path)
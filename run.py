@@ -2,9 +2,17 @@ import argparse
 from itertools import product
 import os
 
-from formindex import FormIndex
+from downloader import Downloader, SEC_RATE_LIMIT, USER_AGENT
+from executor import Executor, available_cpus
+from formindex import FormIndex, FORM_10K_TYPES, iter_records
 from form10k import Form10k
+import htmltext
+from jobstate import JobState
 from mdaparser import MDAParser
+from metrics import Metrics
+from pipeline import FusedPipeline
+from rawcache import RawCache
+from shard import parse_shard, select_shard, shard_root, shard_path
 
 def main():
     ###########################
@@ -14,8 +22,31 @@ def main():
     parser.add_argument('--year_start',type=int,default=2014)
     parser.add_argument('--year_end',type=int,default=2016)
     parser.add_argument('--index_dir',type=str,default='./index')
+    parser.add_argument('--form_types',type=str,nargs='+',default=FORM_10K_TYPES)
+    parser.add_argument('--cik',type=int,nargs='+',default=None)
+    parser.add_argument('--company',type=str,default=None,help='company name substring')
+    parser.add_argument('--date_start',type=str,default=None,help='YYYY-MM-DD')
+    parser.add_argument('--date_end',type=str,default=None,help='YYYY-MM-DD')
     parser.add_argument('--txt_dir',type=str,default='./txt')
     parser.add_argument('--mda_dir',type=str,default='./mda')
+    parser.add_argument('--raw_dir',type=str,default='./raw',help="raw submission cache, '' to disable")
+    parser.add_argument('--mmap',action='store_true',help='memory map texts when extracting MD&A')
+    parser.add_argument('--reprocess',action='store_true',help='rebuild txt_dir from the raw cache only')
+    parser.add_argument('--fused',action='store_true',help='download, extract MD&A and score each filing in one worker pass')
+    parser.add_argument('--score_file',type=str,default=None,help='fused mode score csv, default result{year_start}-{year_end}.csv')
+    parser.add_argument('--sinks',type=str,nargs='*',default=[],choices=['txt','mda'],help='fused mode: also write txt/mda files')
+    parser.add_argument('--rate',type=float,default=SEC_RATE_LIMIT,help='max requests per second')
+    parser.add_argument('--download_workers',type=int,default=16)
+    parser.add_argument('--user_agent',type=str,default=USER_AGENT)
+    parser.add_argument('--html_backend',type=str,default=None,choices=sorted(htmltext.BACKENDS))
+    parser.add_argument('--jobs_db',type=str,default='./jobs.db',help="job state store, '' to disable")
+    parser.add_argument('--retry',type=str,nargs='*',default=[],help="statuses to run again, e.g. FAILED 'MDA NOT FOUND'")
+    parser.add_argument('--ncpus',type=int,default=available_cpus(),help='parsing worker processes')
+    parser.add_argument('--max_pending',type=int,default=None,help='tasks in flight per stage, default 2 x ncpus')
+    parser.add_argument('--shard',type=parse_shard,default=None,help='i/N, run the i-th of N partitions of the selection')
+    parser.add_argument('--shard_dir',type=str,default='./shards',help='shard outputs go to shard_dir/<i>of<N>')
+    parser.add_argument('--metrics_file',type=str,default=None,help='Prometheus textfile of stage counters and histograms')
+    parser.add_argument('--events_file',type=str,default=None,help='JSON lines of every filing result of every stage')
     args = parser.parse_args()
 
     year_start = args.year_start
@@ -24,27 +55,86 @@ def main():
     index_dir = args.index_dir
     txt_dir   = args.txt_dir
     mda_dir   = args.mda_dir
-
-    # Download indices and cache to index directory
+    jobs_db   = args.jobs_db
+    parsing_log = 'parsing.log'
     index_path = "year{}-{}.10k.csv".format(year_start,year_end)
-    
-    formindex = FormIndex(index_dir=index_dir)
-    if not os.path.exists(index_path):
-        formindex = FormIndex(index_dir=index_dir)
-        for year, qtr in product(range(args.year_start,args.year_end+1),range(1,5)):
-            formindex.retrieve(year, qtr)
-        formindex.save(index_path)
+    score_file = args.score_file or "result{}-{}.csv".format(year_start,year_end)
+    metrics_file = args.metrics_file
+    events_file = args.events_file
+
+    if args.shard is not None:
+        # Outputs of each shard are kept apart, python shard.py merges them
+        root = shard_root(args.shard_dir, *args.shard)
+        if not os.path.exists(root):
+            os.makedirs(root)
+        txt_dir, mda_dir, parsing_log, index_path, score_file = \
+            [shard_path(root, path) for path in [txt_dir, mda_dir, parsing_log, index_path, score_file]]
+        jobs_db = shard_path(root, jobs_db) if jobs_db else jobs_db
+        metrics_file = shard_path(root, metrics_file) if metrics_file else metrics_file
+        events_file = shard_path(root, events_file) if events_file else events_file
+
+    downloader = Downloader(rate=args.rate,
+                            max_workers=args.download_workers,
+                            user_agent=args.user_agent)
+
+    # Refresh indices concurrently and cache parsed quarters to index directory
+    formindex = FormIndex(index_dir=index_dir, downloader=downloader)
+    periods = product(range(args.year_start,args.year_end+1),range(1,5))
+    if args.reprocess:
+        # No network, select from the stored indices
+        formindex.load_all(periods)
     else:
-        print("{} already exists".format(index_path))
+        formindex.retrieve_all(periods)
+
+    records = formindex.select(form_types=args.form_types,
+                               cik=args.cik,
+                               company=args.company,
+                               date_start=args.date_start,
+                               date_end=args.date_end)
+    print("{} filings selected".format(len(records)))
+    if args.shard is not None:
+        records = select_shard(records, *args.shard)
+        print("{} filings in shard {}/{}".format(len(records), *args.shard))
+
+    # Keep a flat csv of the selection for reference
+    formindex.save(index_path, records)
 
     # Download 10k forms, parse html and preprocess text
-    form10k = Form10k(txt_dir=txt_dir)
-    form10k.download(index_path=index_path)
+    raw_cache = RawCache(args.raw_dir) if args.raw_dir else None
+    # Stage results of every filing, reruns resume from it (python jobstate.py for progress)
+    job_state = JobState(jobs_db) if jobs_db else None
+    # One process pool for every stage, each stage keeps at most max_pending tasks in it
+    executor = Executor(ncpus=args.ncpus, max_pending=args.max_pending)
+    # Per stage timings and sizes of every filing
+    metrics = Metrics(textfile=metrics_file, events=events_file)
+    form10k = Form10k(txt_dir=txt_dir, html_backend=args.html_backend, raw_cache=raw_cache,
+                      job_state=job_state, executor=executor, metrics=metrics)
+
+    try:
+        if args.fused:
+            # Filing -> MD&A -> score row in one worker, intermediates stay in memory
+            pipeline = FusedPipeline(form10k,
+                                     txt_dir=txt_dir if 'txt' in args.sinks else None,
+                                     mda_dir=mda_dir if 'mda' in args.sinks else None,
+                                     executor=executor)
+            pipeline.run(iter_records(records), score_file, downloader=downloader,
+                         parsing_log=parsing_log, retry=args.retry)
+            return
+
+        if args.reprocess:
+            texts = form10k.iter_reprocess(iter_records(records))
+        else:
+            texts = form10k.iter_download(iter_records(records), downloader=downloader, retry=args.retry)
 
-    # Extract MD&A from processed text
-    # Note that the parser parses every text in the txt_dir, not according to the index file
-    parser = MDAParser(txt_dir=txt_dir, mda_dir=mda_dir)
-    parser.extract()
+        # Extract MD&A from processed text, texts are parsed as soon as they are written
+        # Note that the parser parses every text in the txt_dir, not according to the index file
+        parser = MDAParser(txt_dir=txt_dir, mda_dir=mda_dir, use_mmap=args.mmap, job_state=job_state,
+                           executor=executor, metrics=metrics)
+        parser.extract(retry=args.retry, parsing_log=parsing_log, texts=texts, writing=form10k.writing)
+    finally:
+        downloader.close()
+        metrics.close()
+        metrics.print_summary()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,151 @@
+"""
+    Partition of the selected filings over shards, run.py --shard i/N
+
+    A filing belongs to shard sha1(accession number) % N, so N processes or
+    nodes selecting the same index each take a disjoint part of it without
+    coordination. Shard i writes its txt / mda dirs, job state, parsing.log,
+    selection and score csv files under <shard_dir>/<i>of<N>/.
+
+    python shard.py --shard_dir ./shards --out_dir .  merges the shards:
+      - parsing.log files are concatenated
+      - csv (one header kept) and jsonl event files of the same name are concatenated,
+        except the selection csv that out_dir already holds for the whole index
+      - job state stores are copied into one jobs.db
+"""
+import argparse
+from glob import glob
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from jobstate import JobState
+from rawcache import accession_number
+
+SHARD_NAME = '{}of{}'
+SHARD_PATTERN = re.compile(r'^(\d+)of(\d+)$')
+# Selection csv of run.py, a shard's copy holds only the filings of that shard
+SELECTION_PATTERN = re.compile(r'^year\d+-\d+\.10k\.csv$')
+
+def parse_shard(spec):
+    """
+        'i/N' -> (i, N), 0 <= i < N
+    """
+    try:
+        shard, nshards = [int(x) for x in spec.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("shard must be i/N, got {}".format(spec))
+    if not 0 <= shard < nshards:
+        raise argparse.ArgumentTypeError("shard i/N needs 0 <= i < N, got {}".format(spec))
+    return shard, nshards
+
+def shard_of(accession, nshards):
+    """
+        Shard of an accession number, the same on every machine and run
+    """
+    digest = hashlib.sha1(accession.encode('ascii')).digest()
+    return int.from_bytes(digest[:8], 'big') % nshards
+
+def select_shard(records, shard, nshards):
+    """
+        INDEX_DTYPE records of filings in shard
+    """
+    mask = np.array([shard_of(accession_number(filename.decode('latin-1')), nshards) == shard
+                     for filename in records['filename']], dtype=bool)
+    return records[mask]
+
+def shard_root(shard_dir, shard, nshards):
+    return os.path.join(shard_dir, SHARD_NAME.format(shard, nshards))
+
+def shard_path(root, path):
+    """
+        path moved under a shard root, keeping its base name
+    """
+    return os.path.join(root, os.path.basename(os.path.normpath(path)))
+
+def find_shards(shard_dir):
+    """
+        {shard: root} of the shard roots in shard_dir, all of one N
+    """
+    shards = {}
+    nshards = None
+    for root in sorted(glob(os.path.join(shard_dir, '*'))):
+        match = SHARD_PATTERN.match(os.path.basename(root))
+        if not match or not os.path.isdir(root):
+            continue
+        shard, n = int(match.group(1)), int(match.group(2))
+        if nshards is not None and n != nshards:
+            raise ValueError("{} holds shards of {} and {} partitions".format(shard_dir, nshards, n))
+        nshards = n
+        shards[shard] = root
+
+    if nshards is not None:
+        missing = sorted(set(range(nshards)) - set(shards))
+        if missing:
+            print("Shards {} of {} not found in {}".format(missing, nshards, shard_dir))
+    return shards
+
+def _concat(paths, out_path):
+    """
+        Concatenate text files, the first line of a later file is dropped
+        when it repeats the first line (csv header) of the first file
+    """
+    tmp_path = out_path + '.tmp'
+    header = None
+    with open(tmp_path,'w') as fout:
+        for path in paths:
+            with open(path,'r') as fin:
+                line = next(fin, None)
+                if header is None:
+                    header = line
+                elif line == header:
+                    line = None
+                if line is not None:
+                    fout.write(line)
+                for line in fin:
+                    fout.write(line)
+    os.replace(tmp_path, out_path)
+
+def merge(shard_dir, out_dir='.', jobs_db='jobs.db', parsing_log='parsing.log'):
+    """
+        Merge the parsing.log, score / result csv, event files and job state
+        stores of the shards in shard_dir into out_dir. Selection csv files
+        (year<start>-<end>.10k.csv) are left in the shards.
+    """
+    shards = find_shards(shard_dir)
+    roots = [shards[shard] for shard in sorted(shards)]
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    logs = [shard_path(root, parsing_log) for root in roots]
+    logs = [path for path in logs if os.path.exists(path)]
+    if logs:
+        _concat(logs, os.path.join(out_dir, parsing_log))
+        print("Merged {} parsing logs".format(len(logs)))
+
+    names = sorted(set(os.path.basename(path) for root in roots
+                       for pattern in ['*.csv', '*.jsonl'] for path in glob(os.path.join(root, pattern))
+                       if not SELECTION_PATTERN.match(os.path.basename(path))))
+    for name in names:
+        paths = [os.path.join(root, name) for root in roots if os.path.exists(os.path.join(root, name))]
+        _concat(paths, os.path.join(out_dir, name))
+        print("Merged {} of {} shards".format(name, len(paths)))
+
+    stores = [shard_path(root, jobs_db) for root in roots]
+    stores = [path for path in stores if os.path.exists(path)]
+    if stores:
+        job_state = JobState(os.path.join(out_dir, jobs_db))
+        for path in stores:
+            job_state.merge(path)
+        job_state.print_progress()
+        job_state.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("Merge the outputs of run.py --shard i/N")
+    parser.add_argument('--shard_dir',type=str,default='./shards')
+    parser.add_argument('--out_dir',type=str,default='.')
+    parser.add_argument('--jobs_db',type=str,default='jobs.db')
+    args = parser.parse_args()
+
+    merge(args.shard_dir, args.out_dir, jobs_db=args.jobs_db)
@@ -0,0 +1,332 @@
+"""
+    Synthetic EDGAR corpus for benchmarks, nothing is downloaded
+
+    Everything is drawn from a seeded random.Random, so a corpus is the same
+    on every machine and commit:
+      - submissions: SEC header, 10-K html document (table of contents,
+        PART / ITEM headers, paragraphs, financial tables, html entities),
+        EX-13 annual report when the MD&A is incorporated by reference,
+        EX-21, XBRL instance and uuencoded graphics; primary document sizes
+        are lognormal around --size_kb like EDGAR 10-Ks
+      - a quarterly form.idx with the fixed width layout and form type mix
+        of the full index
+      - a Loughran-McDonald style master dictionary csv covering the words
+        of the texts
+
+    python synthcorpus.py --out_dir ./synthetic --filings 50
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+
+# Words of the texts, in decreasing frequency before the generated ones
+COMMON_WORDS = ['the', 'of', 'and', 'to', 'in', 'a', 'for', 'our', 'we', 'is', 'was', 'by', 'on', 'with',
+                'as', 'from', 'that', 'are', 'be', 'or', 'million', 'net', 'year', 'sales', 'income',
+                'revenue', 'increased', 'decreased', 'compared', 'operating', 'cash', 'costs', 'fiscal',
+                'results', 'due', 'primarily', 'period', 'company', 'expenses', 'financial']
+
+# Sentiment words and their master dictionary category
+SENTIMENT_WORDS = {'loss': 'Negative', 'losses': 'Negative', 'decline': 'Negative', 'impairment': 'Negative',
+                   'adverse': 'Negative', 'restructuring': 'Negative', 'gain': 'Positive',
+                   'improved': 'Positive', 'strong': 'Positive', 'achieve': 'Positive',
+                   'uncertain': 'Uncertainty', 'may': 'Uncertainty', 'approximately': 'Uncertainty',
+                   'believe': 'Uncertainty', 'litigation': 'Litigious', 'claims': 'Litigious',
+                   'settlement': 'Litigious', 'covenants': 'Constraining', 'required': 'Constraining',
+                   'must': 'Modal1', 'will': 'Modal2', 'could': 'Modal3', 'might': 'Modal3'}
+
+DICTIONARY_HEADER = ['Word', 'Sequence Number', 'Word Count', 'Word Proportion', 'Average Proportion',
+                     'Std Dev', 'Doc Count', 'Negative', 'Positive', 'Uncertainty', 'Litigious',
+                     'Constraining', 'Superfluous', 'Interesting', 'Modal', 'Irr_Verb', 'Harvard_IV',
+                     'Syllables', 'Source']
+
+ITEMS = [('I', '1', 'Business', 0.15), ('I', '1A', 'Risk Factors', 0.15),
+         ('I', '1B', 'Unresolved Staff Comments', 0.002), ('I', '2', 'Properties', 0.01),
+         ('I', '3', 'Legal Proceedings', 0.01), ('I', '4', 'Mine Safety Disclosures', 0.002),
+         ('II', '5', 'Market for Registrant\'s Common Equity', 0.02), ('II', '6', 'Selected Financial Data', 0.02),
+         ('II', '7', 'Management\'s Discussion and Analysis of Financial Condition and Results of Operations', 0.2),
+         ('II', '7A', 'Quantitative and Qualitative Disclosures About Market Risk', 0.02),
+         ('II', '8', 'Financial Statements and Supplementary Data', 0.3),
+         ('II', '9', 'Changes in and Disagreements with Accountants', 0.002),
+         ('II', '9A', 'Controls and Procedures', 0.01), ('II', '9B', 'Other Information', 0.002),
+         ('III', '10', 'Directors, Executive Officers and Corporate Governance', 0.01),
+         ('III', '11', 'Executive Compensation', 0.01), ('III', '12', 'Security Ownership', 0.005),
+         ('III', '13', 'Certain Relationships and Related Transactions', 0.005),
+         ('III', '14', 'Principal Accountant Fees and Services', 0.005),
+         ('IV', '15', 'Exhibits and Financial Statement Schedules', 0.015)]
+
+# Share of filings whose MD&A is in an EX-13 annual report
+BY_REFERENCE = 0.1
+
+# Form types of a quarterly index and their weights
+INDEX_FORM_TYPES = [('4', 40), ('8-K', 15), ('10-Q', 6), ('SC 13G', 5), ('424B2', 8), ('D', 4),
+                    ('10-K', 2), ('10-K405', 0.05), ('10-K/A', 0.3), ('S-1', 0.5), ('13F-HR', 1.5)]
+
+SYLLABLES = ['ac', 'al', 'an', 'ar', 'ba', 'be', 'ca', 'co', 'de', 'di', 'en', 'er', 'fi', 'ge', 'in',
+             'is', 'la', 'le', 'ma', 'me', 'na', 'ne', 'or', 'pa', 'po', 're', 'ro', 'sa', 'se', 'ta',
+             'te', 'ti', 'to', 'un', 'va', 've']
+
+class Vocabulary(object):
+    """
+        Zipf distributed words of the texts
+    """
+    def __init__(self, rng, size=20000):
+        words = COMMON_WORDS + sorted(SENTIMENT_WORDS)
+        seen = set(words)
+        while len(words) < size:
+            word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 5)))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        self.words = words
+        total = 0.0
+        self.cum_weights = []
+        for rank in range(len(words)):
+            total += 1.0 / (rank + 2.7)
+            self.cum_weights.append(total)
+
+    def sample(self, rng, k):
+        return rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+
+def number(rng):
+    kind = rng.random()
+    if kind < 0.4:
+        return '${:,.1f} million'.format(rng.lognormvariate(3, 2))
+    if kind < 0.7:
+        return '{:.1f}%'.format(rng.uniform(-40, 60))
+    if kind < 0.85:
+        return 'December 31, {}'.format(rng.randint(2005, 2016))
+    return '{:,}'.format(rng.randint(1, 10 ** 7))
+
+def sentence(rng, vocabulary):
+    words = vocabulary.sample(rng, rng.randint(8, 30))
+    for _ in range(rng.randint(0, 3)):
+        words.insert(rng.randrange(len(words)), number(rng))
+    if len(words) > 12 and rng.random() < 0.5:
+        words[rng.randrange(4, len(words) - 4)] += ','
+    return words[0].capitalize() + ' ' + ' '.join(words[1:]) + '.'
+
+def paragraph(rng, vocabulary):
+    text = ' '.join(sentence(rng, vocabulary) for _ in range(rng.randint(2, 8)))
+    if rng.random() < 0.3:
+        text = text.replace(' and ', ' &amp; ', 1).replace("'s", '&#8217;s')
+    if rng.random() < 0.5:
+        return '<p style="margin-top:6pt"><font size="2">{}</font></p>\n'.format(text)
+    return '<div><font style="font-family:Times New Roman">{}</font></div>\n'.format(text)
+
+def table(rng, vocabulary):
+    rows = []
+    ncols = rng.randint(2, 5)
+    for _ in range(rng.randint(3, 20)):
+        label = ' '.join(vocabulary.sample(rng, rng.randint(1, 4))).capitalize()
+        cells = ''.join('<td>&nbsp;</td><td align="right">{:,}</td>'.format(rng.randint(-10 ** 6, 10 ** 7))
+                        for _ in range(ncols))
+        rows.append('<tr><td>{}</td>{}</tr>'.format(label, cells))
+    return '<table cellpadding="0" cellspacing="0" width="100%">\n{}\n</table>\n'.format('\n'.join(rows))
+
+def section(rng, vocabulary, size, table_share=0.2):
+    parts = []
+    nbytes = 0
+    while nbytes < size:
+        part = table(rng, vocabulary) if rng.random() < table_share else paragraph(rng, vocabulary)
+        parts.append(part)
+        nbytes += len(part)
+    return ''.join(parts)
+
+def form10k_html(rng, vocabulary, size, company, by_reference=False):
+    """
+        Primary 10-K html document of about size bytes
+    """
+    toc = ''.join('<tr><td>Item {}.</td><td>{}</td><td>{}</td></tr>\n'.format(item, title, i + 3)
+                  for i, (_, item, title, _) in enumerate(ITEMS))
+    parts = ['<html><head><title>10-K</title></head><body>\n',
+             '<div align="center"><b>UNITED STATES SECURITIES AND EXCHANGE COMMISSION</b></div>\n',
+             '<div align="center"><b>FORM 10-K</b></div>\n<p>{}</p>\n'.format(company),
+             '<table>\n{}</table>\n'.format(toc)]
+    part = None
+    for part_name, item, title, share in ITEMS:
+        if part_name != part:
+            part = part_name
+            parts.append('<p align="center"><b>PART {}</b></p>\n'.format(part))
+        parts.append('<p><b>Item {}. {}</b></p>\n'.format(item, title))
+        if item == '7' and by_reference:
+            parts.append('<p>The information required by this item is incorporated herein by reference to '
+                         'the section entitled Management&#8217;s Discussion and Analysis in the Annual Report '
+                         'to Shareholders, filed as Exhibit 13.</p>\n')
+        else:
+            parts.append(section(rng, vocabulary, int(size * share), table_share=0.6 if item == '8' else 0.15))
+    parts.append('</body></html>\n')
+    return ''.join(parts)
+
+def uuencoded(rng, size):
+    lines = ['begin 644 g{}.jpg'.format(rng.randint(1, 999))]
+    for _ in range(max(1, size // 61)):
+        lines.append('M' + ''.join(chr(rng.randint(33, 96)) for _ in range(60)))
+    lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+def xbrl(rng, vocabulary, size):
+    facts = []
+    nbytes = 0
+    while nbytes < size:
+        name = ''.join(w.capitalize() for w in vocabulary.sample(rng, 3))
+        fact = '<us-gaap:{0} contextRef="FY{1}" unitRef="usd" decimals="-3">{2}</us-gaap:{0}>\n'.format(
+            name, rng.randint(2010, 2016), rng.randint(0, 10 ** 9))
+        facts.append(fact)
+        nbytes += len(fact)
+    return '<?xml version="1.0"?>\n<xbrli:xbrl>\n{}</xbrli:xbrl>\n'.format(''.join(facts))
+
+def document(doc_type, sequence, filename, text):
+    return ('<DOCUMENT>\n<TYPE>{}\n<SEQUENCE>{}\n<FILENAME>{}\n<DESCRIPTION>{}\n<TEXT>\n{}</TEXT>\n'
+            '</DOCUMENT>\n').format(doc_type, sequence, filename, doc_type, text)
+
+def submission(rng, vocabulary, accession, cik, company, size):
+    """
+        Full text submission (bytes) with a primary 10-K of about size bytes
+    """
+    by_reference = rng.random() < BY_REFERENCE
+    documents = [('10-K', 'form10k.htm', form10k_html(rng, vocabulary, size, company, by_reference))]
+    if by_reference:
+        mda = section(rng, vocabulary, int(size * 0.25))
+        documents.append(('EX-13', 'ex13.htm', '<html><body><p><b>Management&#8217;s Discussion and Analysis</b>'
+                                               '</p>\n{}</body></html>\n'.format(mda)))
+    documents.append(('EX-21', 'ex21.htm', section(rng, vocabulary, 2000, table_share=0.5)))
+    documents.append(('EX-101.INS', 'xbrl.xml', xbrl(rng, vocabulary, int(size * rng.uniform(0.3, 1.0)))))
+    for i in range(rng.randint(0, 3)):
+        documents.append(('GRAPHIC', 'g{}.jpg'.format(i), uuencoded(rng, rng.randint(5000, 60000))))
+
+    header = ('<SEC-DOCUMENT>{0}.txt : 20150227\n<SEC-HEADER>{0}.hdr.sgml : 20150227\n'
+              'ACCESSION NUMBER:\t\t{0}\nCONFORMED SUBMISSION TYPE:\t10-K\n'
+              'PUBLIC DOCUMENT COUNT:\t\t{1}\nCOMPANY CONFORMED NAME:\t\t\t{2}\n'
+              'CENTRAL INDEX KEY:\t\t\t{3:010d}\n</SEC-HEADER>\n').format(accession, len(documents), company, cik)
+    body = ''.join(document(doc_type, i + 1, filename, text)
+                   for i, (doc_type, filename, text) in enumerate(documents))
+    return (header + body + '</SEC-DOCUMENT>\n').encode('utf-8')
+
+def company_name(rng, vocabulary):
+    return ' '.join(w.upper() for w in vocabulary.sample(rng, rng.randint(1, 3))) + \
+        rng.choice([' INC', ' CORP', ' CO', ' LTD', ' HOLDINGS INC', ' TRUST'])
+
+def form_index(rng, vocabulary, nrows, year=2015, qtr=1):
+    """
+        form.idx content (bytes) of nrows filings
+    """
+    head = ('Description:           Master Index of EDGAR Dissemination Feed by Form Type\n'
+            'Last Data Received:    March 31, {0}\n\n'
+            'Form Type   Company Name                                                  CIK         '
+            'Date Filed  File Name\n'.format(year) + '-' * 140 + '\n')
+    types, weights = zip(*INDEX_FORM_TYPES)
+    rows = []
+    for form_type in sorted(rng.choices(types, weights=weights, k=nrows)):
+        cik = rng.randint(1000, 1700000)
+        rows.append('{:<12}{:<62}{:<12}{:<12}edgar/data/{}/{:010d}-{:02d}-{:06d}.txt'.format(
+            form_type, company_name(rng, vocabulary)[:61], cik,
+            '{}-{:02d}-{:02d}'.format(year, 3 * qtr - rng.randint(0, 2), rng.randint(1, 28)),
+            cik, rng.randint(1, 10 ** 9), year % 100, rng.randint(0, 999999)))
+    return (head + '\n'.join(rows) + '\n').encode('latin-1')
+
+def master_dictionary(rng, vocabulary, path, size=85000):
+    """
+        Write a master dictionary csv of size words, the vocabulary first
+    """
+    words = list(vocabulary.words)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 7)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+
+    with open(path, 'w') as fout:
+        fout.write(','.join(DICTIONARY_HEADER) + '\n')
+        for i, word in enumerate(words):
+            flags = dict.fromkeys(['Negative', 'Positive', 'Uncertainty', 'Litigious', 'Constraining'], 0)
+            modal = 0
+            category = SENTIMENT_WORDS.get(word)
+            if category is None and rng.random() < 0.04:
+                category = rng.choice(sorted(flags))
+            if category is not None and category.startswith('Modal'):
+                modal = int(category[-1])
+            elif category is not None:
+                flags[category] = 2009
+            count = int(rng.lognormvariate(6, 3))
+            fields = [word.upper(), i + 1, count, count / 1e9, count / 2e9, count / 3e9, count // 10 + 1,
+                      flags['Negative'], flags['Positive'], flags['Uncertainty'], flags['Litigious'],
+                      flags['Constraining'], 0, 0, modal, 0, 0, max(1, len(word) // 3), '12of12inf']
+            fout.write(','.join(map(str, fields)) + '\n')
+
+def primary_sizes(rng, n, size_kb):
+    """
+        Lognormal primary document sizes around size_kb, within 20 KB .. 40 x size_kb
+    """
+    return [int(min(max(rng.lognormvariate(math.log(size_kb * 1000), 0.7), 20000), 40 * size_kb * 1000))
+            for _ in range(n)]
+
+def write_corpus(out_dir, filings=50, seed=0, size_kb=300, index_rows=100000):
+    """
+        Generate the corpus in out_dir unless it is there with the same
+        parameters, returns its meta dict
+    """
+    meta = {'filings': filings, 'seed': seed, 'size_kb': size_kb, 'index_rows': index_rows}
+    meta_path = os.path.join(out_dir, 'corpus.json')
+    sub_dir = os.path.join(out_dir, 'submissions')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as fin:
+            existing = json.load(fin)
+        if {k: existing.get(k) for k in meta} == meta and \
+           os.path.isdir(sub_dir) and len(os.listdir(sub_dir)) == filings:
+            return existing
+        # Submissions of other parameters would be benchmarked along
+        os.remove(meta_path)
+    if os.path.exists(sub_dir):
+        shutil.rmtree(sub_dir)
+
+    rng = random.Random(seed)
+    vocabulary = Vocabulary(rng)
+    os.makedirs(sub_dir)
+
+    nbytes = 0
+    for i, size in enumerate(primary_sizes(rng, filings, size_kb)):
+        cik = rng.randint(1000, 1700000)
+        accession = '{:010d}-15-{:06d}'.format(cik, i)
+        content = submission(rng, vocabulary, accession, cik, company_name(rng, vocabulary), size)
+        with open(os.path.join(sub_dir, '{}_{}.txt'.format(cik, accession)), 'wb') as fout:
+            fout.write(content)
+        nbytes += len(content)
+
+    with open(os.path.join(out_dir, 'form.idx'), 'wb') as fout:
+        fout.write(form_index(rng, vocabulary, index_rows))
+    master_dictionary(rng, vocabulary, os.path.join(out_dir, 'LoughranMcDonald_MasterDictionary_synthetic.csv'))
+
+    meta['submission_bytes'] = nbytes
+    with open(meta_path, 'w') as fout:
+        json.dump(meta, fout, indent=2)
+    return meta
+
+def corpus_paths(out_dir):
+    """
+        (submission files, form.idx, dictionary csv) of a corpus
+    """
+    with open(os.path.join(out_dir, 'corpus.json'), 'r') as fin:
+        meta = json.load(fin)
+    sub_dir = os.path.join(out_dir, 'submissions')
+    submissions = sorted(os.path.join(sub_dir, name) for name in os.listdir(sub_dir))
+    if len(submissions) != meta['filings']:
+        raise ValueError("{} has {} submissions, its corpus.json {}".format(
+            sub_dir, len(submissions), meta['filings']))
+    return (submissions,
+            os.path.join(out_dir, 'form.idx'),
+            os.path.join(out_dir, 'LoughranMcDonald_MasterDictionary_synthetic.csv'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out_dir', type=str, default='./synthetic')
+    parser.add_argument('--filings', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size_kb', type=int, default=300, help='median primary 10-K document size')
+    parser.add_argument('--index_rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(json.dumps(write_corpus(args.out_dir, args.filings, args.seed, args.size_kb, args.index_rows), indent=2))
@@ -0,0 +1,111 @@
+"""
+    Downloader against a local stand-in for the SEC server
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from downloader import Downloader, RateLimiter
+
+class Handler(BaseHTTPRequestHandler):
+    """
+        /ok           200
+        /flaky/<n>    500 for the first n requests, then 200
+        /limited/<n>  429 with Retry-After for the first n requests, then 200
+    """
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.log.append((time.monotonic(), self.path))
+            count = server.counts[self.path] = server.counts.get(self.path, 0) + 1
+
+        parts = self.path.strip('/').split('/')
+        status, headers = 200, {}
+        if parts[0] == 'flaky' and count <= int(parts[1]):
+            status = 500
+        elif parts[0] == 'limited' and count <= int(parts[1]):
+            status, headers = 429, {'Retry-After': str(server.retry_after)}
+
+        body = self.path.encode()
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.lock = threading.Lock()
+    httpd.log = []
+    httpd.counts = {}
+    httpd.retry_after = 0.5
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_port)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_retries_server_errors(server):
+    downloader = Downloader(rate=100, backoff=0.01)
+    assert downloader.fetch(server.url + '/flaky/2') == b'/flaky/2'
+    assert server.counts['/flaky/2'] == 3
+    downloader.close()
+
+def test_gives_up_after_max_retries(server):
+    downloader = Downloader(rate=100, backoff=0.01, max_retries=2)
+    r = downloader.get(server.url + '/flaky/10')
+    assert r.status_code == 500
+    assert server.counts['/flaky/10'] == 3
+    downloader.close()
+
+def test_retry_after_pauses_every_thread(server):
+    downloader = Downloader(rate=100, backoff=0.01)
+    stop = threading.Event()
+
+    def poll():
+        while not stop.is_set():
+            downloader.get(server.url + '/ok')
+    threads = [threading.Thread(target=poll) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(0.1)
+        assert downloader.fetch(server.url + '/limited/1') == b'/limited/1'
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        downloader.close()
+
+    limited = [t for t, path in server.log if path == '/limited/1']
+    assert len(limited) == 2
+    assert limited[1] - limited[0] >= server.retry_after
+    # Nothing reached the server while the 429 was being waited out
+    during = [t for t, path in server.log if limited[0] + 0.05 < t < limited[1] - 0.05]
+    assert during == []
+
+def test_rate(server):
+    rate, n = 20, 30
+    downloader = Downloader(rate=rate, max_workers=8)
+    urls = [server.url + '/ok?{}'.format(i) for i in range(n)]
+    start = time.monotonic()
+    assert len(list(downloader.imap(urls))) == n
+    seconds = time.monotonic() - start
+    downloader.close()
+    # A full bucket of rate tokens, then rate per second
+    assert seconds >= (n - rate) / rate * 0.95
+
+def test_rate_limiter_pause():
+    limiter = RateLimiter(rate=1000)
+    limiter.pause(0.2)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.19
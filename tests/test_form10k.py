@@ -0,0 +1,82 @@
+"""
+    Form10k._parse_submission on synthetic submissions
+"""
+import random
+
+import dill
+
+import synthcorpus
+from form10k import Form10k, find_exhibit_mda, split_submission
+from mdaparser import MDAParser
+
+def make_submission(by_reference, exhibit_mda=None, size=20000, seed=0):
+    rng = random.Random(seed)
+    vocabulary = synthcorpus.Vocabulary(rng, size=2000)
+    documents = [('10-K', 'form10k.htm', synthcorpus.form10k_html(rng, vocabulary, size, 'ACME INC', by_reference))]
+    if exhibit_mda is not None:
+        documents.append(('EX-13', 'ex13.htm', exhibit_mda))
+    documents.append(('EX-21', 'ex21.htm', synthcorpus.section(rng, vocabulary, 2000)))
+    body = ''.join(synthcorpus.document(doc_type, i + 1, filename, text)
+                   for i, (doc_type, filename, text) in enumerate(documents))
+    return ('<SEC-DOCUMENT>\n' + body + '</SEC-DOCUMENT>\n').encode('utf-8')
+
+ANNUAL_REPORT = ('<html><body>'
+                 '<p>Contents</p><p>Management&#8217;s Discussion and Analysis 12</p>'
+                 '<p>Consolidated Statements of Income 30</p>'
+                 '<p><b>Management&#8217;s Discussion and Analysis</b></p>\n'
+                 + '<p>Net sales grew in every segment during the fiscal year under review.</p>\n' * 40 +
+                 '<p><b>Consolidated Statements of Income</b></p><p>Revenue 1,234</p>'
+                 '</body></html>')
+
+def parse(content):
+    text = Form10k(None)._parse_submission(content)
+    return text, MDAParser(None, None).find_mda(text)
+
+def test_split_submission_keeps_10k_and_ex13():
+    content = make_submission(True, ANNUAL_REPORT)
+    assert [doc_type for doc_type, _ in split_submission(content)] == [b'10-K', b'EX-13']
+
+def test_mda_by_reference_found_in_exhibit():
+    text, mda = parse(make_submission(True, ANNUAL_REPORT))
+    assert mda.startswith('ITEM 7.')
+    assert 'NET SALES GREW IN EVERY SEGMENT' in mda
+    # The table of contents of the annual report and its financial statements are left out
+    assert 'REVENUE 1,234' not in text
+    assert text.count('NET SALES GREW') == 40
+
+def test_exhibit_without_heading_is_appended():
+    exhibit = '<html><body><p>Letter to shareholders.</p></body></html>'
+    text, _ = parse(make_submission(True, exhibit))
+    assert text.rstrip().endswith('LETTER TO SHAREHOLDERS.')
+
+def test_exhibit_ignored_without_reference():
+    text, mda = parse(make_submission(False, ANNUAL_REPORT))
+    assert 'NET SALES GREW' not in text
+    assert len(mda) > 1000
+
+def test_reference_outside_item7_ignored():
+    # A proxy statement reference of a later item, a short way after ITEM 7, is not the MD&A
+    content = make_submission(False, ANNUAL_REPORT, size=2000)
+    assert content.count(b'<p><b>Item 10.') == 1
+    content = content.replace(
+        b'<p><b>Item 10.', b'<p><b>Item 10.</b></p><p>Incorporated herein by reference to the proxy.</p><p><b>')
+    text, _ = parse(content)
+    assert 'NET SALES GREW' not in text
+
+def test_find_exhibit_mda_skips_table_of_contents():
+    text = Form10k(None)._process_text('\n'.join(['Management’s Discussion and Analysis 12',
+                                                  'Consolidated Statements of Income 30',
+                                                  'Management’s Discussion and Analysis'] +
+                                                 ['Sales grew.'] * 200 +
+                                                 ['Consolidated Statements of Income']))
+    mda = find_exhibit_mda(text)
+    assert mda.startswith('MANAGEMENT’S DISCUSSION AND ANALYSIS\n')
+    assert mda.count('SALES GREW.') == 200
+    assert 'CONSOLIDATED' not in mda
+
+def test_writing_not_pickled():
+    form10k = Form10k('txt')
+    form10k.writing = set('{:010d}-15-{:06d}'.format(i, i) for i in range(10000))
+    worker = dill.loads(dill.dumps(form10k))
+    assert worker.writing == set() and worker.txt_dir == 'txt'
+    assert len(form10k.writing) == 10000
@@ -0,0 +1,57 @@
+"""
+    formindex.parse_form_index against the original row parser
+"""
+import os
+
+import pytest
+
+from formindex import IndexRecord, iter_records, parse_form_index
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def parse_rows_reference(data):
+    """
+        Rows of the original FormIndex.extract, for every form type
+    """
+    records = []
+    fields_begin = None
+    for row in data.splitlines(True):
+        row = row.decode('ascii')
+        if row.startswith("Form Type"):
+            fields_begin = [ row.find("Form Type"),
+                             row.find("Company Name"),
+                             row.find('CIK'),
+                             row.find('Date Filed'),
+                             row.find("File Name") ]
+        elif fields_begin is not None and row.strip() and not row.startswith('---'):
+            record = []
+            for begin, end in zip(fields_begin[:],fields_begin[1:] + [len(row)] ):
+                field = row[begin:end].rstrip()
+                field = field.strip('\"')
+                record.append(field)
+            records.append(IndexRecord(*record))
+    return records
+
+def read_index():
+    with open(os.path.join(FIXTURES, 'form.idx'), 'rb') as fin:
+        return fin.read()
+
+@pytest.mark.parametrize('newline', [b'\n', b'\r\n'])
+def test_matches_reference(newline):
+    data = read_index().replace(b'\n', newline)
+    expected = parse_rows_reference(data)
+    assert len(expected) == 12
+    assert list(iter_records(parse_form_index(data))) == expected
+
+def test_columns():
+    records = parse_form_index(read_index())
+    assert records['company_name'][1] == b'LEADING QUOTE" HOLDINGS INC'
+    assert records['company_name'][3] == b'QUOTED NAME LLC'
+    assert list(records['form_type'][4:8]) == [b'10-K/A', b'10-K405', b'10-KSB', b'10-KT']
+    assert records['cik'][10] == 1234567890
+    assert str(records['date_filed'][5]) == '1998-12-23'
+
+def test_compact_dates():
+    # Early indexes write YYYYMMDD
+    data = read_index().replace(b'2014-09-12', b'20140912  ')
+    assert str(parse_form_index(data)['date_filed'][0]) == '2014-09-12'
@@ -0,0 +1,105 @@
+"""
+    Generic_Parser scoring on a synthetic master dictionary
+"""
+import csv
+import gc
+import glob
+import os
+import random
+import re
+import string
+
+import pytest
+
+import Generic_Parser
+from Generic_Parser import NUMBER, Scorer
+import synthcorpus
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+@pytest.fixture(scope='module')
+def dictionary_file(tmp_path_factory):
+    # The vocabulary of tests/fixtures/form10k.htm comes first
+    path = str(tmp_path_factory.mktemp('dictionary') / 'LoughranMcDonald_MasterDictionary_test.csv')
+    rng = random.Random(0)
+    synthcorpus.master_dictionary(rng, synthcorpus.Vocabulary(rng, size=2000), path, size=3000)
+    return path
+
+def count_numbers_reference(doc):
+    """
+        Number count of the original get_data, kept to check NUMBER against
+    """
+    doc = re.sub('(?!=[0-9])(\\.|,)(?=[0-9])', '', doc)
+    doc = doc.translate(str.maketrans(string.punctuation, " " * len(string.punctuation)))
+    return len(re.findall(r'\b[-+\(]?[$€£]?[-+(]?\d+\)?\b', doc))
+
+def read_rows(path):
+    with open(path) as fin:
+        return list(csv.reader(fin))[1:]
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fout:
+        fout.write(text)
+
+def test_update_keys_files_by_path(dictionary_file, tmp_path):
+    a = str(tmp_path / 'a' / '1_0001.mda')
+    b = str(tmp_path / 'b' / '1_0001.mda')
+    write(a, 'The loss of the company.')
+    write(b, 'Growth and gains of the company were strong, the loss declined.')
+    output = str(tmp_path / 'result.csv')
+    scorer = Scorer(dictionary_file)
+
+    scorer.update([a, b], output)
+    first = read_rows(output)
+    assert [row[0] for row in first] == ['1_0001', '1_0001']
+    assert first[0] != first[1]
+
+    # Unchanged files keep their own rows
+    scorer.update([a, b], output)
+    assert read_rows(output) == first
+    scorer.update([b, a], output)
+    assert read_rows(output) == [first[1], first[0]]
+
+def test_update_rescores_on_scorer_version(dictionary_file, tmp_path, monkeypatch):
+    path = str(tmp_path / 'mda' / '2_0002.mda')
+    write(path, 'The loss of the company.')
+    output = str(tmp_path / 'result.csv')
+    scorer = Scorer(dictionary_file)
+    scorer.update([path], output)
+
+    calls = []
+    score_file = Scorer.score_file
+    monkeypatch.setattr(Scorer, 'score_file', lambda self, f: calls.append(f) or score_file(self, f))
+    scorer.update([path], output)
+    assert calls == []
+
+    monkeypatch.setattr(Generic_Parser, 'SCORER_VERSION', Generic_Parser.SCORER_VERSION + 1)
+    scorer.update([path], output)
+    assert calls == [path]
+
+def test_scores_match_expected_rows(dictionary_file):
+    # tests/fixtures/expected_scores.csv was written by the original
+    # Generic_Parser.py with this dictionary
+    with open(os.path.join(FIXTURES, 'expected_scores.csv')) as fin:
+        expected = list(csv.reader(fin))
+    scorer = Scorer(dictionary_file)
+    rows = [[str(x) for x in scorer.score_file(path)]
+            for path in sorted(glob.glob(os.path.join(FIXTURES, 'mda', '*.mda')))]
+    assert [Generic_Parser.OUTPUT_FIELDS] + rows == expected
+
+def test_number_count_matches_reference():
+    rng = random.Random(0)
+    alphabet = '0123456789..,, \naZ_-$€£()%²١½'
+    docs = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 16))) for _ in range(20000)]
+    for path in glob.glob(os.path.join(FIXTURES, 'mda', '*.mda')):
+        with open(path, encoding='utf-8') as fin:
+            docs.append(fin.read().upper())
+    for doc in docs:
+        assert len(NUMBER.findall(doc)) == count_numbers_reference(doc), doc
+
+def test_parallel_rows_and_unfreeze(dictionary_file):
+    paths = sorted(glob.glob(os.path.join(FIXTURES, 'mda', '*.mda')))
+    scorer = Scorer(dictionary_file)
+    assert list(scorer.imap(paths * 4, jobs=2)) == [scorer.score_file(path) for path in paths * 4]
+    assert gc.get_freeze_count() == 0
@@ -0,0 +1,47 @@
+"""
+    The lxml backend gives the same processed text as the BeautifulSoup reference
+"""
+import os
+
+import pytest
+
+import htmltext
+from normalizer import process_text
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+HTML_FILES = ['form10k.htm', 'edge_cases.htm']
+
+def read(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fin:
+        return fin.read()
+
+@pytest.mark.parametrize('name', HTML_FILES)
+def test_lxml_matches_bs4(name):
+    content = read(name)
+    assert process_text(htmltext.get_text(content, 'lxml')) == process_text(htmltext.get_text(content, 'bs4'))
+
+@pytest.mark.parametrize('name', HTML_FILES)
+def test_lxml_chunk_boundaries(name, monkeypatch):
+    # Text nodes, tags and entities split between feeds
+    content = read(name)
+    expected = htmltext.get_text(content, 'lxml')
+    monkeypatch.setattr(htmltext, 'CHUNK_SIZE', 7)
+    assert htmltext.get_text(content, 'lxml') == expected
+
+def test_skips_script_and_style():
+    text = htmltext.get_text(read('edge_cases.htm'), 'lxml')
+    assert 'notText' not in text
+    assert 'margin: 0' not in text
+    assert 'a comment' not in text
+
+def test_str_and_bytes():
+    content = read('edge_cases.htm')
+    assert htmltext.get_text(content, 'lxml') == htmltext.get_text(content.decode('utf-8'), 'lxml')
+
+def test_windows_1252_fallback():
+    content = '<p>Caf\xe9 ’s</p>'.encode('windows-1252')
+    assert process_text(htmltext.get_text(content, 'lxml')) == process_text(htmltext.get_text(content, 'bs4'))
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        htmltext.get_text(b'<p>x</p>', 'html5lib')
@@ -0,0 +1,29 @@
+"""
+    MDAParser.extract resuming from a job state
+"""
+import os
+
+from executor import Executor
+from jobstate import JobState
+from mdaparser import MDAParser
+
+def test_rewritten_texts_are_parsed_again(tmp_path):
+    txt_dir, mda_dir = str(tmp_path / 'txt'), str(tmp_path / 'mda')
+    job_state = JobState(str(tmp_path / 'jobs.db'))
+    parser = MDAParser(txt_dir, mda_dir, job_state=job_state, executor=Executor(1))
+    for name in ['1_0001-15-000001', '2_0002-15-000002']:
+        with open(os.path.join(txt_dir, name + '.txt'), 'w') as fout:
+            fout.write('NO ITEMS HERE\n')
+        job_state.record(name.split('_')[1], 'mda', 'SUCCESS')
+
+    def texts():
+        # Form10k.iter_reprocess writing 0002-15-000002 again
+        yield '2_0002-15-000002.txt'
+
+    parsing_log = str(tmp_path / 'parsing.log')
+    parser.extract(parsing_log=parsing_log, texts=texts(), writing={'0002-15-000002'})
+    with open(parsing_log) as fin:
+        assert fin.read() == '2_0002-15-000002.txt,MDA NOT FOUND\n'
+    assert job_state.status('0002-15-000002', 'mda') == 'MDA NOT FOUND'
+    assert job_state.status('0001-15-000001', 'mda') == 'SUCCESS'
+    job_state.close()
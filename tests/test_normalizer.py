@@ -0,0 +1,46 @@
+"""
+    normalizer.process_text gives the output of the original implementation
+"""
+import os
+
+import pytest
+
+import htmltext
+import normalizer
+from normalizer import process_text, process_text_reference
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+TEXTS = [
+    '',
+    '\n',
+    'plain ascii text',
+    'item\n7.\nmanagement\n',
+    'I\nTEM 7.  \n  \n\nresults:\n$\n12.5\n%',
+    'crlf\r\nline\r\n\r\n  breaks\r\n',
+    'mixed\rbreaks\x0bvertical\x0cform\x1cfs\x85nel ls ps',
+    'trailing spaces   \n   leading spaces\n\n\n\nmany breaks',
+    'Café naïve résumé ’quoted’ ﬁnance ＡＢ x² ½',
+    'straße İstanbul é ẞ',
+    '\n.\n\nITEM\nITEM\n\nITEM  7',
+]
+
+def html_text(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fin:
+        return htmltext.get_text(fin.read(), 'bs4')
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_matches_reference(text):
+    assert process_text(text) == process_text_reference(text)
+
+@pytest.mark.parametrize('name', ['form10k.htm', 'edge_cases.htm'])
+def test_matches_reference_on_fixtures(name):
+    text = html_text(name)
+    assert process_text(text) == process_text_reference(text)
+
+def test_non_ascii_chunks(monkeypatch):
+    # NFKD and upper on line aligned chunks give the same result as on the whole text
+    text = html_text('edge_cases.htm') * 20
+    expected = process_text_reference(text)
+    monkeypatch.setattr(normalizer, 'CHUNK_SIZE', 64)
+    assert process_text(text) == expected
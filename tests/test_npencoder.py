@@ -0,0 +1,163 @@
+"""
+    npencoder.Model against a direct transcription of the encoder.py mLSTM,
+    on small random weights
+"""
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import npencoder
+
+NHIDDEN = 16
+NEMBD = 8
+
+@pytest.fixture(scope='module')
+def model_dir(tmp_path_factory):
+    """
+        model/*.npy layout of encoder.py: embd, wx, wh as 4 gate blocks,
+        wmx, wmh, b, gx, gh, gmx, gmh, out w, out b
+    """
+    path = tmp_path_factory.mktemp('model')
+    rng = np.random.default_rng(0)
+    shapes = [(256, NEMBD), (NEMBD, 4 * NHIDDEN)] + [(NHIDDEN, NHIDDEN)] * 4 + \
+             [(NEMBD, NHIDDEN), (NHIDDEN, NHIDDEN), (4 * NHIDDEN,), (4 * NHIDDEN,), (4 * NHIDDEN,),
+              (NHIDDEN,), (NHIDDEN,), (NHIDDEN, 256), (256,)]
+    for i, shape in enumerate(shapes):
+        np.save(str(path / '{}.npy'.format(i)), rng.normal(size=shape).astype(np.float32))
+    return str(path)
+
+@pytest.fixture
+def utils_stub(monkeypatch):
+    # utils.py ships with the model files, not with this repository
+    utils = types.ModuleType('utils')
+    utils.preprocess = lambda text: ('\n ' + text + ' ').encode()
+    utils.iter_data = lambda xs, size: (xs[i:i+size] for i in range(0, len(xs), size))
+    monkeypatch.setitem(sys.modules, 'utils', utils)
+    return utils
+
+def l2_normalize(w, g):
+    return w / np.sqrt(np.maximum(np.sum(w * w, axis=0), 1e-12)) * g
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+def reference_run(params, xmb, mmb, smb):
+    """
+        encoder.mlstm with wn=True and a mask, in float64: the states of
+        every timestep
+    """
+    embd, wx, wh, wmx, wmh, b, gx, gh, gmx, gmh = [p.astype(np.float64) for p in params[:10]]
+    wx, wh, wmx, wmh = l2_normalize(wx, gx), l2_normalize(wh, gh), l2_normalize(wmx, gmx), l2_normalize(wmh, gmh)
+    c, h = smb[0].astype(np.float64), smb[1].astype(np.float64)
+    cs = []
+    for idx in range(xmb.shape[1]):
+        x = embd[xmb[:, idx]]
+        m = (x @ wmx) * (h @ wmh)
+        z = x @ wx + m @ wh + b
+        i, f, o, u = np.split(z, 4, axis=1)
+        i, f, o, u = sigmoid(i), sigmoid(f), sigmoid(o), np.tanh(u)
+        ct = f * c + i * u
+        ht = o * np.tanh(ct)
+        mask = mmb[:, idx, :]
+        c = ct * mask + c * (1 - mask)
+        h = ht * mask + h * (1 - mask)
+        cs.append(c)
+    return np.stack(cs), np.stack([c, h])
+
+def reference_features(params, text):
+    """
+        Final cell state of one preprocessed text run from zero states
+    """
+    x = np.frombuffer(text, dtype=np.uint8)[None, :]
+    smb = np.zeros((2, 1, NHIDDEN))
+    _, states = reference_run(params, x, np.ones((1, x.shape[1], 1)), smb)
+    return states[0, 0]
+
+def random_batch(rng, nbatch=5, nsteps=12):
+    xmb = rng.integers(0, 256, size=(nbatch, nsteps)).astype(np.int32)
+    # Left padded rows of different lengths, as batch_pad makes them
+    lens = rng.integers(0, nsteps + 1, size=nbatch)
+    lens[0] = nsteps
+    mmb = (np.arange(nsteps)[None, :] >= (nsteps - lens)[:, None]).astype(np.float32)[:, :, None]
+    smb = rng.normal(size=(2, nbatch, NHIDDEN)).astype(np.float32)
+    return xmb, mmb, smb
+
+def test_seq_rep_and_cells(model_dir):
+    params = npencoder.load_params(model_dir)
+    model = npencoder.Model(nbatch=4, nsteps=12, model_dir=model_dir)
+    xmb, mmb, smb = random_batch(np.random.default_rng(1))
+    cells, states = reference_run(params, xmb, mmb, smb)
+    np.testing.assert_allclose(model.seq_rep(xmb, mmb, smb), states, rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(model.seq_cells(xmb, mmb, smb), cells, rtol=1e-4, atol=1e-5)
+
+def test_transform(model_dir, utils_stub):
+    params = npencoder.load_params(model_dir)
+    # Texts longer than nsteps and more of them than nbatch
+    texts = ['', 'a', 'demo!', 'net sales increased', 'x' * 30, 'losses were offset by gains in 2015'] * 2
+    model = npencoder.Model(nbatch=4, nsteps=8, model_dir=model_dir)
+    expected = np.stack([reference_features(params, utils_stub.preprocess(text)) for text in texts])
+    features = model.transform(texts)
+    assert features.shape == (len(texts), NHIDDEN)
+    np.testing.assert_allclose(features, expected, rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(model.transform(texts, indexes=[3, 5]), expected[:, [3, 5]], rtol=1e-4, atol=1e-5)
+
+def test_cell_transform(model_dir, utils_stub):
+    params = npencoder.load_params(model_dir)
+    texts = ['demo!', 'net sales', 'up']
+    model = npencoder.Model(nbatch=2, nsteps=16, model_dir=model_dir)
+    cells = model.cell_transform(texts)
+    assert cells.shape == (len(texts), 16, NHIDDEN)
+    for text, text_cells in zip(texts, cells):
+        x = np.frombuffer(utils_stub.preprocess(text), dtype=np.uint8)
+        expected, _ = reference_run(params, x[None, :], np.ones((1, len(x), 1)), np.zeros((2, 1, NHIDDEN)))
+        # Left padding keeps the zero state until the text starts
+        np.testing.assert_allclose(text_cells[16 - len(x):], expected[:, 0], rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(text_cells[:16 - len(x)], 0)
+
+@pytest.fixture
+def weights():
+    w = np.random.default_rng(2).normal(size=(40, 24)).astype(np.float32)
+    w[:, 3] = 0
+    return w
+
+def test_int8_error(weights):
+    matrix = npencoder.ReducedMatrix(weights, 'int8')
+    assert matrix.data.dtype == np.int8
+    scale = np.abs(weights).max(axis=0) / 127
+    # Rounding to the nearest step of each column, zero columns exactly
+    error = np.abs(matrix.toarray() - weights)
+    assert np.all(error <= scale / 2 * (1 + 1e-5) + 1e-7)
+    assert np.all(matrix.toarray()[:, 3] == 0)
+
+def test_bfloat16_error(weights):
+    matrix = npencoder.ReducedMatrix(weights, 'bfloat16')
+    assert matrix.data.dtype == np.uint16
+    # 7 stored mantissa bits, rounded to nearest
+    np.testing.assert_allclose(matrix.toarray(), weights, rtol=2 ** -8, atol=0)
+    assert npencoder.to_bfloat16(np.array([1 + 2 ** -8], dtype=np.float32))[0] == 0x3f80
+    assert npencoder.to_bfloat16(np.array([1 + 3 * 2 ** -8], dtype=np.float32))[0] == 0x3f82
+
+@pytest.mark.parametrize('precision', ['int8', 'bfloat16'])
+def test_blocked_matmul(monkeypatch, weights, precision):
+    # 7 rows per block, the last block is short
+    monkeypatch.setattr(npencoder, 'BLOCK_BYTES', 7 * 4 * weights.shape[1])
+    matrix = npencoder.ReducedMatrix(weights, precision)
+    assert matrix.block == 7
+    x = np.random.default_rng(3).normal(size=(5, weights.shape[0])).astype(np.float32)
+    z = x @ matrix
+    assert z.dtype == np.float32 and z.shape == (5, weights.shape[1])
+    np.testing.assert_allclose(z, x @ matrix.toarray(), rtol=1e-5, atol=1e-5)
+
+def test_precision_selection(model_dir):
+    model = npencoder.Model(nbatch=4, nsteps=12, model_dir=model_dir)
+    assert isinstance(model.wh, np.ndarray) and model.wh.dtype == np.float32
+    for precision, dtype in [('int8', np.int8), ('bfloat16', np.uint16)]:
+        reduced = npencoder.Model(nbatch=4, nsteps=12, model_dir=model_dir, precision=precision)
+        assert reduced.wh.data.dtype == dtype and reduced.wmh.data.dtype == dtype
+        xmb, mmb, smb = random_batch(np.random.default_rng(4))
+        np.testing.assert_allclose(reduced.seq_rep(xmb, mmb, smb), model.seq_rep(xmb, mmb, smb), atol=0.1)
+    with pytest.raises(ValueError):
+        npencoder.Model(model_dir=model_dir, precision='float16')
@@ -0,0 +1,26 @@
+"""
+    shard.merge of run.py --shard outputs
+"""
+import os
+
+import shard
+
+def write(path, text):
+    with open(path, 'w') as fout:
+        fout.write(text)
+
+def test_merge_keeps_selection(tmp_path):
+    shard_dir, out_dir = tmp_path / 'shards', tmp_path / 'out'
+    out_dir.mkdir()
+    write(str(out_dir / 'year2014-2014.10k.csv'), 'filename\nall\n')
+    for i in range(2):
+        root = shard.shard_root(str(shard_dir), i, 2)
+        os.makedirs(root)
+        write(os.path.join(root, 'year2014-2014.10k.csv'), 'filename\nshard{}\n'.format(i))
+        write(os.path.join(root, 'result2014-2014.csv'), 'filename,score\n{},{}\n'.format(i, i))
+        write(os.path.join(root, 'parsing.log'), '{}.txt,SUCCESS\n'.format(i))
+
+    shard.merge(str(shard_dir), str(out_dir))
+    assert (out_dir / 'year2014-2014.10k.csv').read_text() == 'filename\nall\n'
+    assert (out_dir / 'result2014-2014.csv').read_text() == 'filename,score\n0,0\n1,1\n'
+    assert (out_dir / 'parsing.log').read_text() == '0.txt,SUCCESS\n1.txt,SUCCESS\n'
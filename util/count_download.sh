@@ -1,8 +1,4 @@
 #!/bin/bash
 
-ntotal=$(wc -l < year2014-2016.10k.csv)
-while true; do 
-	ncurr=$(ls txt | wc -l)
-	echo "Download text progress: $ncurr/$ntotal"
-	sleep 300
-done
+# Progress of every stage, read from the job state store written by run.py
+python jobstate.py "${1:-jobs.db}"
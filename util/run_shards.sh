@@ -0,0 +1,46 @@
+#!/bin/bash
+
+# Run N shards of run.py as separate processes on this machine, then merge them
+#   util/run_shards.sh N [run.py arguments]
+# The SEC request rate and the cpus are split between the shards,
+# later --rate / --ncpus arguments override the split.
+# Nothing is merged unless every shard exits successfully.
+N=${1:?usage: run_shards.sh N [run.py arguments]}
+shift
+
+# Merge from where run.py writes the shards
+SHARD_DIR=./shards
+JOBS_DB=jobs.db
+args=("$@")
+for ((j = 0; j < ${#args[@]}; j++)); do
+    case "${args[j]}" in
+        --shard_dir) SHARD_DIR=${args[j + 1]} ;;
+        --shard_dir=*) SHARD_DIR=${args[j]#*=} ;;
+        --jobs_db) JOBS_DB=${args[j + 1]} ;;
+        --jobs_db=*) JOBS_DB=${args[j]#*=} ;;
+    esac
+done
+
+RATE=$(python -c "from downloader import SEC_RATE_LIMIT; print(SEC_RATE_LIMIT / $N)")
+NCPUS=$(python -c "from executor import available_cpus; print(max(1, available_cpus() // $N))")
+
+mkdir -p "$SHARD_DIR"
+pids=()
+for ((i = 0; i < N; i++)); do
+    python run.py --shard "$i/$N" --rate "$RATE" --ncpus "$NCPUS" "$@" > "$SHARD_DIR/run${i}of${N}.log" 2>&1 &
+    pids+=($!)
+done
+
+failed=0
+for ((i = 0; i < N; i++)); do
+    if ! wait "${pids[i]}"; then
+        echo "shard $i/$N failed, see $SHARD_DIR/run${i}of${N}.log" >&2
+        failed=1
+    fi
+done
+if [ "$failed" -ne 0 ]; then
+    echo "not merging partial results, rerun to resume the failed shards" >&2
+    exit 1
+fi
+
+python shard.py --shard_dir "$SHARD_DIR" --out_dir . --jobs_db "$(basename "${JOBS_DB:-jobs.db}")"